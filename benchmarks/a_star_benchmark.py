@@ -0,0 +1,99 @@
+"""Compare the heap-based A* engine with the former list-based one."""
+import argparse
+from time import perf_counter
+from typing import Iterable, Optional
+from benchmarks.grids import generate_grid
+from modules.maze_operations.a_star_search import AStarSearcher, _CellNode
+from modules.maze_operations.maze_adt import Maze
+
+
+class LegacyAStarSearcher(AStarSearcher):
+    """The former A* implementation with linear open and closed lists."""
+
+    def _generate_children(self, cell: _CellNode) -> Iterable[_CellNode]:
+        """Generate all valid neighbours for the cell."""
+        for i, ii in self.allowed_moves:
+            new_pos = (cell.data[0] + i, cell.data[1] + ii)
+            if self._is_valid_pos(*new_pos):
+                yield _CellNode(new_pos, cell)
+
+    @staticmethod
+    def _build_cell_path(cell: _CellNode) -> set:
+        """Build the final path as a set of coordinates."""
+        path = set()
+        while cell is not None:
+            path.add(cell.data)
+            cell = cell.next
+        return path
+
+    def search_path(self) -> Optional[set]:
+        """Search for the path scanning the open list for every step."""
+        if not (self._is_valid_pos(*self.start.data) and
+                self._is_valid_pos(*self.finish.data)):
+            return None
+
+        if self.start == self.finish:
+            return self._build_cell_path(self.start)
+
+        estimate = self.heuristic.bind(self.finish.data)
+        closed_list = []
+        open_list = [self.start]
+
+        while len(open_list) > 0:
+            curr_i = min(range(len(open_list)),
+                         key=lambda i: open_list[i].f)
+            curr_node = open_list.pop(curr_i)
+            closed_list.append(curr_node)
+            for child in self._generate_children(curr_node):
+                if child == self.finish:
+                    return self._build_cell_path(child)
+                if child in closed_list:
+                    continue
+                child.g = curr_node.g + 1
+                child.h = estimate(*child.data)
+                child.f = child.g + child.h
+                for cell in open_list:
+                    if child == cell and cell.f <= child.f:
+                        break
+                else:
+                    open_list.append(child)
+        return None
+
+
+def time_search(searcher: AStarSearcher) -> (float, int):
+    """Time a single search.
+
+    :return: seconds spent and length of the found path
+    """
+    begin = perf_counter()
+    path = searcher.search_path()
+    return perf_counter() - begin, len(path) if path else 0
+
+
+def main():
+    """Run the benchmark on generated grids and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 50, 100, 200, 500, 1000])
+    parser.add_argument("--legacy-limit", type=int, default=200,
+                        help="largest grid to run the legacy engine on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'grid':>11} {'heap, s':>10} {'legacy, s':>10} "
+          f"{'speedup':>8} {'path':>7}")
+    for size in args.sizes:
+        maze = Maze("benchmark", size=(size, size),
+                    array=generate_grid(size, args.seed))
+        heap_time, path_len = time_search(AStarSearcher(maze))
+        if size <= args.legacy_limit:
+            legacy_time, legacy_len = time_search(LegacyAStarSearcher(maze))
+            assert legacy_len == path_len, "engines disagree on the path"
+            legacy = f"{legacy_time:10.4f} {legacy_time / heap_time:7.1f}x"
+        else:
+            legacy = f"{'skipped':>10} {'-':>8}"
+        print(f"{size:>5}x{size:<5} {heap_time:10.4f} {legacy} {path_len:7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Generate maze grids for benchmarking."""
+import random
+
+
+def generate_grid(size: int, seed: int = 0) -> list:
+    """Generate a perfect maze grid using a randomized backtracker.
+
+    Cells lie on even coordinates, odd ones are walls until carved.
+    :param size: number of rows and columns of the grid
+    :param seed: seed for the random generator
+    :return: list representation of the maze (1 - wall, 2 - start, 3 - end)
+    """
+    rng = random.Random(seed)
+    grid = [[1] * size for _ in range(size)]
+    last = (size - 1) // 2 * 2
+    grid[0][0] = 0
+    stack = [(0, 0)]
+    while stack:
+        i, ii = stack[-1]
+        options = [(i + di, ii + dii) for di, dii in
+                   ((0, -2), (0, 2), (-2, 0), (2, 0))
+                   if 0 <= i + di <= last and 0 <= ii + dii <= last and
+                   grid[i + di][ii + dii] == 1]
+        if not options:
+            stack.pop()
+            continue
+        new_i, new_ii = rng.choice(options)
+        grid[(i + new_i) // 2][(ii + new_ii) // 2] = 0
+        grid[new_i][new_ii] = 0
+        stack.append((new_i, new_ii))
+    grid[0][0] = 2
+    grid[last][last] = 3
+    return grid
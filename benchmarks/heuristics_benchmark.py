@@ -0,0 +1,57 @@
+"""Measure how many cells A* expands with every heuristic."""
+import argparse
+from pathlib import Path
+from time import perf_counter
+from modules.maze_operations.a_star_search import AStarSearcher
+from modules.maze_operations.heuristics import LandmarkHeuristic, \
+    ManhattanHeuristic, ZeroHeuristic
+from modules.maze_operations.maze_adt import Maze
+
+
+def load_corpus(database: Path) -> list:
+    """Load every maze grid stored in the database.
+
+    Mazes sharing a grid (different hyperparameters) are loaded once.
+    """
+    mazes = {}
+    for path in sorted(database.iterdir()):
+        if not ((path / "header.json").exists() or
+                (path / "data.json").exists()):
+            continue
+        maze = Maze.read_from_database(path)
+        mazes.setdefault(maze.name.split("-")[0], maze)
+    return list(mazes.values())
+
+
+def main():
+    """Solve the corpus with every heuristic and print the totals."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", type=Path,
+                        default=Path("modules/web_handling/static/database"))
+    args = parser.parse_args()
+
+    mazes = load_corpus(args.database)
+    heuristics = {"zero": lambda maze: ZeroHeuristic(),
+                  "manhattan": lambda maze: ManhattanHeuristic(),
+                  "landmarks": LandmarkHeuristic}
+    print(f"{len(mazes)} mazes from {args.database}")
+    print(f"{'heuristic':>10} {'expanded':>9} {'saved':>7} {'time, s':>9}")
+    baseline = None
+    for name, build in heuristics.items():
+        expanded = 0
+        elapsed = 0.0
+        for maze in mazes:
+            heuristic = build(maze)
+            searcher = AStarSearcher(maze, heuristic)
+            begin = perf_counter()
+            searcher.search_path()
+            elapsed += perf_counter() - begin
+            expanded += searcher.expanded
+        if baseline is None:
+            baseline = expanded
+        saved = 1 - expanded / baseline if baseline else 0
+        print(f"{name:>10} {expanded:9} {saved:7.1%} {elapsed:9.4f}")
+
+
+if __name__ == '__main__':
+    main()
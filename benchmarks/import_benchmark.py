@@ -0,0 +1,54 @@
+"""Measure import time of the web app and of a headless training worker."""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGETS = {"app": "modules.web_handling.app",
+           "worker": "modules.maze_operations.process_maze"}
+HEAVY = ("cv2", "matplotlib", "PIL", "requests")
+
+
+def import_times(module: str) -> dict:
+    """Import the module in a fresh interpreter with -X importtime.
+
+    :param module: dotted name of the module
+    :return: cumulative import time in microseconds of every module
+    """
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    # run elsewhere so that the app does not leave session files behind
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                 f"import {module}"], cwd=cwd, env=env,
+                                capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    """Print the startup time of every target and the heavy imports."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per target, the best one is shown")
+    args = parser.parse_args()
+
+    for target, module in TARGETS.items():
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda times: times[module])
+        heavy = ", ".join(f"{name} {best[name] / 1000:.0f} ms"
+                          for name in HEAVY if name in best) or "none"
+        print(f"{target:>6}: {best[module] / 1000:8.1f} ms "
+              f"({module}), heavy imports: {heavy}")
+
+
+if __name__ == '__main__':
+    main()
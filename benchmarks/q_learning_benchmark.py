@@ -0,0 +1,90 @@
+"""Compare the Q Learning step loop with the former per-step RNG calls."""
+import argparse
+from time import perf_counter
+import numpy as np
+from benchmarks.grids import generate_grid
+from modules.maze_operations.maze_adt import Maze
+from modules.maze_operations.q_learner import QLearner
+from modules.maze_operations.training_metrics import MetricsSink
+
+
+class LegacyQLearner(QLearner):
+    """Step loop drawing from the global numpy RNG on every step."""
+
+    def choose_action(self, obs: int) -> int:
+        """Choose the action with scalar calls to the global RNG."""
+        if np.random.random() > self.epsilon:
+            return np.argmax(self.q_table[obs])
+        return np.random.randint(0, 4)
+
+    def train_single_episode(self, episode: int,
+                             episode_rewards: MetricsSink,
+                             learning_rate: float, discount: float,
+                             verbose: bool, track: bool = False) -> bool:
+        """Train a single episode calling the RNG for every step."""
+        obs = self.start_state
+        episode_reward = 0
+        for _ in range(self.iterations):
+            choice = self.choose_action(obs)
+            new_obs = self.transitions[obs, choice]
+            reward = self.rewards[obs, choice]
+            max_future_q = np.max(self.q_table[new_obs])
+            current_q = self.q_table[obs, choice]
+            if reward == self.FINISH_REWARD:
+                new_q = self.FINISH_REWARD
+            else:
+                new_q = ((1 - learning_rate) * current_q +
+                         learning_rate * (reward + discount * max_future_q))
+            self.q_table[obs, choice] = new_q
+            episode_reward += reward
+            obs = new_obs
+            if reward == self.FINISH_REWARD:
+                self.epsilon *= self.EPS_DECAY
+                episode_rewards.append(int(episode_reward))
+                return False
+        self.epsilon *= self.EPS_DECAY
+        episode_rewards.append(int(episode_reward))
+        return True
+
+
+def time_episodes(learner: QLearner, episodes: int) -> float:
+    """Time training of a number of episodes.
+
+    :return: seconds spent
+    """
+    rewards = MetricsSink()
+    begin = perf_counter()
+    for episode in range(episodes):
+        learner.train_single_episode(episode, rewards, 0.1, 0.95, False)
+    return perf_counter() - begin
+
+
+def main():
+    """Run the benchmark on generated grids and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 20, 30])
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'grid':>11} {'blocks, s':>10} {'legacy, s':>10} "
+          f"{'speedup':>8} {'reproducible':>13}")
+    for size in args.sizes:
+        maze = Maze("benchmark", size=(size, size),
+                    array=generate_grid(size, args.seed))
+        np.random.seed(args.seed)
+        legacy_time = time_episodes(LegacyQLearner(maze, seed=args.seed),
+                                    args.episodes)
+        block_time = time_episodes(QLearner(maze, seed=args.seed),
+                                   args.episodes)
+        # equal seeds should give equal routes
+        routes = [QLearner(maze, seed=args.seed).train_env()["solution_path"]
+                  for _ in range(2)]
+        print(f"{size:>5}x{size:<5} {block_time:10.4f} {legacy_time:10.4f} "
+              f"{legacy_time / block_time:7.1f}x "
+              f"{str(routes[0] == routes[1]):>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from modules.maze_operations.maze_adt import Maze
 from modules.maze_operations.process_maze import BackgroundProcessor
 from modules.maze_operations.q_learner import QLearner
 from modules.helper_collections.llistqueue import Queue
+from modules.helper_collections.blocking_queue import BlockingQueue
 from modules.maze_operations.maze_list import MazesList
 
 
@@ -10,25 +11,24 @@ class VerboseBGProcessor(BackgroundProcessor):
     """For demonstration."""
 
     @staticmethod
-    def process_maze(maze):
+    def process_maze(maze, job_id=None):
         """Print the maze."""
-        print(maze) # waits for ten seconds if queue is empty
+        print(maze) # waits until a maze is pushed
 
 
 if __name__ == '__main__':
     m_list = MazesList("database/options.json", "database/mazes_list.json")
     # maze2 = Maze.read_from_database("database/my_maze")
-    queue = Queue()
+    queue = BlockingQueue()
     maze2 = Maze("small_maze", array=[[2, 0], [0, 3]], size=(2, 2))
     queue.push(maze2)
     VerboseBGProcessor(queue, m_list).start()
     maze1 = Maze.from_api("my_maze")
-    maze1._find_optimal_route()  #uses AStarSearcher and _CellNode
+    maze1._find_optimal_route()  #uses the cached BFS distance field
     queue.push(maze1)
     new_queue = Queue()
     new_queue.push(maze1)
     new_queue.push(maze2)
-    # uses QAgent
     print(QLearner(maze1, show_episodes=50).train_env(verbose=True))
     maze3 = Maze.from_api("new_maze", maze_id="5da9f969461a8c0017016912")
     QLearner(maze3, show_episodes=250).train_env(verbose=True)
@@ -0,0 +1,113 @@
+"""Implementation of a thread-safe bounded queue with blocking reads."""
+import threading
+from time import monotonic
+from typing import Any
+from modules.helper_collections.llistqueue import Queue
+
+
+class QueueFull(Exception):
+    """Indicates that a bounded queue has no room for an item."""
+    pass
+
+
+class QueueEmpty(Exception):
+    """Indicates that no item arrived before the timeout."""
+    pass
+
+
+class BlockingQueue:
+    """Represent a thread-safe queue shared by producers and consumers.
+
+    Items are kept in a linked list queue guarded by a lock; consumers
+    sleep on a condition until an item is pushed, so there is no polling.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        """Create an empty queue.
+
+        :param maxsize: maximum number of items (unbounded if not positive)
+        """
+        self.maxsize = maxsize
+        self._items = Queue()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # counters
+        self.pushed = 0
+        self.popped = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self) -> int:
+        """Return the number of items in the queue."""
+        with self._lock:
+            return len(self._items)
+
+    def isEmpty(self) -> bool:
+        """Return True if the queue is empty and False otherwise."""
+        with self._lock:
+            return self._items.isEmpty()
+
+    def isFull(self) -> bool:
+        """Return True if a bounded queue is full and False otherwise."""
+        with self._lock:
+            return self._full()
+
+    def _full(self) -> bool:
+        """Check fullness (the lock must be held)."""
+        return 0 < self.maxsize <= len(self._items)
+
+    def push(self, item: Any, block: bool = False, timeout: float = None):
+        """Push the item in the rear of the queue.
+
+        :param item: item to push
+        :param block: whether to wait for room in a full queue
+        :param timeout: maximum time to wait (forever if None)
+        :exception QueueFull: no room for the item
+        """
+        with self._not_full:
+            if block:
+                self._not_full.wait_for(lambda: not self._full(), timeout)
+            if self._full():
+                self.rejected += 1
+                raise QueueFull("queue is full")
+            self._items.push((item, monotonic()))
+            self.pushed += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+
+    def get(self, timeout: float = None) -> Any:
+        """Remove and return the first item waiting for it if needed.
+
+        :param timeout: maximum time to wait (forever if None)
+        :exception QueueEmpty: no item arrived in time
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(
+                    lambda: not self._items.isEmpty(), timeout):
+                raise QueueEmpty("no item in the queue")
+            item, pushed_at = self._items.pop()
+            wait = monotonic() - pushed_at
+            self.popped += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._not_full.notify()
+            return item
+
+    def pop(self) -> Any:
+        """Remove and return the first item without waiting."""
+        return self.get(timeout=0)
+
+    def stats(self) -> dict:
+        """Get queue depth and wait time counters."""
+        with self._lock:
+            return {"depth": len(self._items),
+                    "max_depth": self.max_depth,
+                    "pushed": self.pushed,
+                    "popped": self.popped,
+                    "rejected": self.rejected,
+                    "mean_wait": self.total_wait / self.popped
+                    if self.popped else 0.0,
+                    "max_wait": self.max_wait}
@@ -1,8 +1,11 @@
 """Use A* to find the optimal route through a maze."""
 from __future__ import annotations
 from modules.helper_collections.node import Node
+from modules.maze_operations.heuristics import Heuristic, ManhattanHeuristic
+from heapq import heappush, heappop
 from math import inf
-from typing import Optional, Iterable
+from typing import Optional
+import numpy as np
 
 
 class _CellNode(Node):
@@ -28,14 +31,21 @@ class _CellNode(Node):
 
 
 class AStarSearcher:
-    """Detect an optimal path in a maze."""
+    """Detect an optimal path in a maze.
+
+    Cells are addressed by their flat index (row * row length + column),
+    the open list is a binary heap with lazy deletion and visited cells are
+    marked in a bitmap, so every step costs O(log n). The number of
+    expanded cells of the last search is kept in ``expanded``.
+    """
     allowed_moves = ((0, -1), (0, 1), (-1, 0), (1, 0))
 
-    def __init__(self, maze):
+    def __init__(self, maze, heuristic: Heuristic = None):
         """Create a new A* searcher based on a maze.
 
         :param maze: maze to base upon
         :type maze: Maze
+        :param heuristic: distance estimate (Manhattan to goal by default)
         """
         self.array = maze.array
         self.start = _CellNode(maze.start)
@@ -43,11 +53,8 @@ class AStarSearcher:
         self.finish = _CellNode(maze.finish)
         self.col_len = len(maze.array)
         self.row_len = len(maze.array[0])
-
-    def _calc_heuristic(self, cell: _CellNode) -> int:
-        """Calculate the heuristic (Manhattan Distance) for the cell."""
-        return (abs(cell.data[0] - self.start.data[0]) +
-                abs(cell.data[1] - self.start.data[1]))
+        self.heuristic = heuristic or ManhattanHeuristic()
+        self.expanded = 0
 
     def _is_valid_pos(self, pos_i: int, pos_ii: int) -> bool:
         """Check if position belongs to the maze
@@ -60,58 +67,71 @@ class AStarSearcher:
                 self.row_len > pos_ii >= 0 and
                 self.array[pos_i][pos_ii] != 1)
 
-    def _is_final(self, cell: _CellNode) -> bool:
-        """Check if the cell if the end goal."""
-        return cell == self.finish
+    def _index(self, pos: (int, int)) -> int:
+        """Get the flat index of a cell."""
+        return pos[0] * self.row_len + pos[1]
+
+    def _blocked_cells(self) -> bytearray:
+        """Build a bitmap of cells that cannot be entered (walls)."""
+        return bytearray((np.asarray(self.array) == 1).tobytes())
 
-    def _generate_children(self, cell: _CellNode) -> Iterable[_CellNode]:
-        """Generate all valid neighbours for the cell."""
-        for i, ii in self.allowed_moves:
-            new_pos = (cell.data[0] + i, cell.data[1] + ii)
-            if self._is_valid_pos(*new_pos):
-                yield _CellNode(new_pos, cell)
+    def _build_path(self, parents: list, index: int) -> set:
+        """Build the final path as a set of coordinates.
 
-    @staticmethod
-    def _build_path(cell: _CellNode) -> set:
-        """Build the final path as a set of coordinates."""
+        :param parents: flat index of the previous cell for every cell
+        :param index: flat index of the last cell of the path
+        """
         path = set()
-        while cell is not None:
-            path.add(cell.data)
-            cell = cell.next
+        while index != -1:
+            path.add(divmod(index, self.row_len))
+            index = parents[index]
         # set of tuples of integers
         return path
 
     def search_path(self) -> Optional[set]:
         """Search for the path using A*."""
+        self.expanded = 0
         if not (self._is_valid_pos(*self.start.data) and
                 self._is_valid_pos(*self.finish.data)):
             return None
 
-        if self.start == self.finish:
-            return self._build_path(self.start)
-
-        # visited and unvisited but detected cells
-        closed_list = []
-        open_list = []
-
-        open_list.append(self.start)
-
-        while len(open_list) > 0:
-            curr_i = min(range(len(open_list)),
-                         key=lambda i: open_list[i].f)
-            curr_node = open_list.pop(curr_i)
-            closed_list.append(curr_node)
-            for child in self._generate_children(curr_node):
-                if self._is_final(child):
-                    return self._build_path(child)
-                if child in closed_list:
+        col_len, row_len = self.col_len, self.row_len
+        estimate = self.heuristic.bind(self.finish.data)
+        start = self._index(self.start.data)
+        finish = self._index(self.finish.data)
+        # walls and already expanded cells share one bitmap
+        closed = self._blocked_cells()
+        best_g = [inf] * len(closed)
+        parents = [-1] * len(closed)
+        best_g[start] = 0
+        # (f, h, index): ties go to the cell closer to the goal
+        h = estimate(*self.start.data)
+        open_heap = [(h, h, start)]
+        expanded = 0
+        path = None
+
+        while open_heap:
+            f, h, curr = heappop(open_heap)
+            if closed[curr]:
+                # stale entry superseded by a cheaper one
+                continue
+            if curr == finish:
+                path = self._build_path(parents, curr)
+                break
+            closed[curr] = 1
+            expanded += 1
+            g = f - h + 1
+            pos_i, pos_ii = divmod(curr, row_len)
+            for i, ii in self.allowed_moves:
+                new_i, new_ii = pos_i + i, pos_ii + ii
+                if not (col_len > new_i >= 0 and row_len > new_ii >= 0):
                     continue
-                child.g = curr_node.g + 1
-                child.h = self._calc_heuristic(child)
-                child.f = child.g + child.h
-                for cell in open_list:
-                    if child == cell and cell.f <= child.f:
-                        break
-                else:
-                    open_list.append(child)
-        return None
+                child = new_i * row_len + new_ii
+                if closed[child] or g >= best_g[child]:
+                    continue
+                best_g[child] = g
+                parents[child] = curr
+                h = estimate(new_i, new_ii)
+                heappush(open_heap, (g + h, h, child))
+        self.expanded = expanded
+        return path
@@ -0,0 +1,112 @@
+"""Heuristics estimating the remaining distance for A*."""
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Iterable
+import numpy as np
+
+Estimate = Callable[[int, int], int]
+
+
+class Heuristic(ABC):
+    """An admissible estimate of the distance to the goal.
+
+    A heuristic is bound to a goal once per search, the returned function
+    is then called for every discovered cell.
+    """
+
+    @abstractmethod
+    def bind(self, goal: (int, int)) -> Estimate:
+        """Get an estimating function for the goal.
+
+        :param goal: coordinates of the finish cell
+        :return: function of row and column returning the estimate
+        """
+
+
+class ManhattanHeuristic(Heuristic):
+    """Manhattan distance to the goal."""
+
+    def bind(self, goal: (int, int)) -> Estimate:
+        """Get an estimating function for the goal."""
+        goal_i, goal_ii = goal
+        return lambda pos_i, pos_ii: (abs(pos_i - goal_i) +
+                                      abs(pos_ii - goal_ii))
+
+
+class ZeroHeuristic(Heuristic):
+    """No estimate at all, turns A* into Dijkstra's algorithm (BFS)."""
+
+    def bind(self, goal: (int, int)) -> Estimate:
+        """Get an estimating function for the goal."""
+        return lambda pos_i, pos_ii: 0
+
+
+class LandmarkHeuristic(Heuristic):
+    """ALT heuristic: triangle inequality over precomputed landmarks.
+
+    Exact distances from a few landmark cells are computed once per maze,
+    so the heuristic pays off for mazes that are searched repeatedly.
+    """
+    allowed_moves = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+    def __init__(self, maze, landmarks: int = 4):
+        """Precompute distances from the landmarks.
+
+        :param maze: maze to base upon
+        :type maze: Maze
+        :param landmarks: number of landmarks to pick
+        """
+        self.col_len = len(maze.array)
+        self.row_len = len(maze.array[0])
+        self._walls = bytearray((np.asarray(maze.array) == 1).tobytes())
+        self.landmarks = []
+        self.distances = []
+        self._pick_landmarks(maze.start, landmarks)
+
+    def _neighbours(self, index: int) -> Iterable[int]:
+        """Generate flat indexes of the open neighbours of a cell."""
+        pos_i, pos_ii = divmod(index, self.row_len)
+        for i, ii in self.allowed_moves:
+            new_i, new_ii = pos_i + i, pos_ii + ii
+            if self.col_len > new_i >= 0 and self.row_len > new_ii >= 0:
+                child = new_i * self.row_len + new_ii
+                if not self._walls[child]:
+                    yield child
+
+    def _bfs(self, source: int) -> list:
+        """Get distances from the source to every cell (-1 if unreachable)."""
+        distances = [-1] * len(self._walls)
+        distances[source] = 0
+        frontier = deque((source,))
+        while frontier:
+            curr = frontier.popleft()
+            for child in self._neighbours(curr):
+                if distances[child] == -1:
+                    distances[child] = distances[curr] + 1
+                    frontier.append(child)
+        return distances
+
+    def _pick_landmarks(self, seed: (int, int), number: int):
+        """Pick landmarks one by one as far as possible from the others."""
+        spread = self._bfs(seed[0] * self.row_len + seed[1])
+        for _ in range(number):
+            landmark = max(range(len(spread)), key=spread.__getitem__)
+            if spread[landmark] <= 0:
+                break
+            distances = self._bfs(landmark)
+            self.landmarks.append(divmod(landmark, self.row_len))
+            self.distances.append(distances)
+            spread = [min(old, new) for old, new in zip(spread, distances)]
+
+    def bind(self, goal: (int, int)) -> Estimate:
+        """Get an estimating function for the goal."""
+        row_len = self.row_len
+        goal = goal[0] * row_len + goal[1]
+        tables = [(table, table[goal]) for table in self.distances
+                  if table[goal] != -1]
+
+        def estimate(pos_i: int, pos_ii: int) -> int:
+            index = pos_i * row_len + pos_ii
+            return max((abs(to_goal - table[index])
+                        for table, to_goal in tables), default=0)
+        return estimate
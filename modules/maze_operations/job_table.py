@@ -0,0 +1,176 @@
+"""Track the processing of submitted mazes."""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+QUEUED = "queued"
+SUBMITTED = "submitted"  # handed to the process pool, may still wait there
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CACHED = "cached"
+
+
+class Job:
+    """Processing state of a single submitted maze."""
+
+    def __init__(self, name: str):
+        """Create a new queued job.
+
+        :param name: name of the submitted maze
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.state = QUEUED
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        # state and timings of every hyperparameter configuration
+        self.configs = {}
+        # incremented on every change, lets watchers skip unchanged states
+        self.version = 0
+
+    def to_dict(self) -> dict:
+        """Get a JSON-serializable representation of the job."""
+        end = self.finished if self.finished is not None else time.time()
+        return {"id": self.id,
+                "name": self.name,
+                "state": self.state,
+                "error": self.error,
+                "submitted": self.submitted,
+                "started": self.started,
+                "finished": self.finished,
+                "elapsed": end - self.submitted,
+                "configs": {config: dict(state) for config, state in
+                            self.configs.items()},
+                "version": self.version}
+
+
+class JobTable:
+    """In-memory table of jobs shared by the app and the processor.
+
+    Jobs move from queued to running and end as done or failed; every
+    hyperparameter configuration of a running job has its own state, and
+    those trained in the process pool are only known to be submitted until
+    they finish.
+    Only the last ``capacity`` finished jobs are kept.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        """Create an empty table.
+
+        :param capacity: number of finished jobs to keep
+        """
+        self.capacity = capacity
+        self.changed = threading.Condition()
+        self._jobs = {}
+        self._queued = OrderedDict()
+        self._finished = OrderedDict()
+
+    def create(self, name: str) -> Job:
+        """Add a queued job for a maze.
+
+        :param name: name of the maze
+        :return: the new job
+        """
+        job = Job(name)
+        with self.changed:
+            self._jobs[job.id] = job
+            self._queued[job.id] = None
+        return job
+
+    def discard(self, job_id: str):
+        """Remove a job that never made it into the queue."""
+        with self.changed:
+            self._jobs.pop(job_id, None)
+            self._queued.pop(job_id, None)
+
+    def _update(self, job_id: str, **changes) -> Optional[Job]:
+        """Change the attributes of a job and wake up the watchers.
+
+        Must be called with the lock held.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.__dict__.update(changes)
+        job.version += 1
+        self.changed.notify_all()
+        return job
+
+    def start(self, job_id: str):
+        """Mark the job as taken from the queue."""
+        with self.changed:
+            self._queued.pop(job_id, None)
+            self._update(job_id, state=RUNNING, started=time.time())
+
+    def update_config(self, job_id: str, config: str, state: str):
+        """Change the state of a hyperparameter configuration of the job.
+
+        :param job_id: id of the job
+        :param config: configuration (learning rate-discount)
+        :param state: new state of the configuration
+        """
+        now = time.time()
+        with self.changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            entry = job.configs.setdefault(config, {"state": QUEUED,
+                                                    "started": None,
+                                                    "finished": None})
+            entry["state"] = state
+            if state == RUNNING:
+                entry["started"] = now
+            elif state in (DONE, FAILED, CACHED):
+                entry["finished"] = now
+            self._update(job_id)
+
+    def finish(self, job_id: str, error: str = None):
+        """Mark the job as done, or as failed if there is an error."""
+        with self.changed:
+            self._queued.pop(job_id, None)
+            job = self._update(job_id, state=FAILED if error else DONE,
+                               error=error, finished=time.time())
+            if job is None:
+                return
+            self._finished[job_id] = None
+            while len(self._finished) > self.capacity:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Get the state of a job.
+
+        :param job_id: id of the job
+        :return: representation of the job with its queue position (from 0)
+        if it is queued, None if there is no such job
+        """
+        with self.changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            state = job.to_dict()
+            if job_id in self._queued:
+                state["position"] = list(self._queued).index(job_id)
+            return state
+
+    def wait(self, job_id: str, version: int,
+             timeout: float = None) -> Optional[dict]:
+        """Wait until the job changes after the version.
+
+        :param job_id: id of the job
+        :param version: last version seen by the caller
+        :param timeout: seconds to wait at most
+        :return: the new state, the current one on timeout, None if the
+        job is gone
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: job_id not in self._jobs or
+                self._jobs[job_id].version > version, timeout
+            )
+            return self.get(job_id)
@@ -1,15 +1,19 @@
 """Represent a maze."""
 from __future__ import annotations
-import requests
+import hashlib
+import numpy as np
 from modules.helper_collections.arrays import Array2D
 import os
 import json
 import re
+from itertools import chain
+from operator import itemgetter
 from pathlib import Path
-from modules.maze_operations.a_star_search import AStarSearcher
+from modules.maze_operations.maze_api_client import MazeAPIClient, \
+    default_client
+from modules.maze_operations.maze_solver import DISTANCE_CACHE
 from modules.maze_operations.q_learner import QLearner
-from PIL import Image
-from typing import Any, Collection, Union
+from typing import Any, Collection, Iterator, Union
 
 
 class MazeConstructionError(Exception):
@@ -29,10 +33,19 @@ class MazeUnsolvableError(Exception):
     pass
 
 
+class MazeFormatError(Exception):
+    """Indicates that a stored maze has an unknown format."""
+    pass
+
+
 class Maze:
     """Represent a maze."""
     START = 2  # indicates start position in the array
     END = 3  # indicates end position in the array
+    FORMAT_VERSION = 2  # version of the binary database format
+    # shift from the node an exit leads to back to the passage cell
+    EXIT_CODES = {"n": 0, "s": 1, "w": 2, "e": 3}
+    EXIT_SHIFTS = np.array(((-1, 0), (1, 0), (0, 1), (0, -1)))
 
     def __init__(self, name: str = None, size: tuple = (0, 0),
                  array: list = None, **kwargs):
@@ -40,7 +53,7 @@ class Maze:
 
         :param name: name of the maze
         :param size: size of the maze (two-dimensional tuple)
-        :param array: list representation o the maze
+        :param array: list or uint8 grid representation of the maze
         :param kwargs: other possible arguments
         """
         if re.fullmatch(r"[\w_\d]+", name):
@@ -49,10 +62,11 @@ class Maze:
             raise MazeNameError(f"name should be an allowed one")
 
         self.size = tuple(map(int, size))
-        # self.array = self._list_to_array(array)
-        self.array = array
+        # one contiguous grid shared with the A* and Q Learning engines
+        self.array = np.ascontiguousarray(array, dtype=np.uint8)
         allowed_params = {"optimal_route": [],
                           "q_data": {},
+                          "metrics": {},
                           "img": None,
                           "learning_rate": 0.1,
                           "discount": 0.95,
@@ -86,15 +100,38 @@ class Maze:
 
     def _search_endpoints(self):
         """Search the array for the start and end position."""
-        array = self.array
-        for i in range(self.size[0]):
-            for ii in range(self.size[1]):
-                if array[i][ii] == self.START:
-                    self.start = (i, ii)
-                elif array[i][ii] == self.END:
-                    self.finish = (i, ii)
-        if self.start is None or self.finish is None:
+        starts = np.argwhere(self.array == self.START)
+        finishes = np.argwhere(self.array == self.END)
+        if not len(starts) or not len(finishes):
             raise MazeUnsolvableError("no endpoints")
+        self.start = tuple(map(int, starts[-1]))
+        self.finish = tuple(map(int, finishes[-1]))
+
+    def content_hash(self, learning_rate: float = None,
+                     discount: float = None,
+                     warm_start: bool = False) -> str:
+        """Get a hash of everything the training results depend on.
+
+        :param learning_rate: learning rate (the maze's one if None)
+        :param discount: discount rate (the maze's one if None)
+        :param warm_start: whether training starts from the shortest routes
+        prior
+        :return: hex digest of the grid, endpoints and training settings
+        """
+        if learning_rate is None:
+            learning_rate = self.learning_rate
+        if discount is None:
+            discount = self.discount
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(self.array).tobytes())
+        digest.update(json.dumps([self.array.shape, self.start, self.finish,
+                                  float(learning_rate),
+                                  float(discount), bool(warm_start)]).encode())
+        return digest.hexdigest()
+
+    def to_list(self) -> list:
+        """Get the list representation of the maze (as used in JSON)."""
+        return self.array.tolist()
 
     @staticmethod
     def _scale(*args: Union[str, int], adder: int = 0) -> tuple:
@@ -122,20 +159,16 @@ class Maze:
         exits = node["exits"]
         for direction in exits:
             coords = cls._get_coords(exits[direction])
-            if direction == "n":
-                yield coords[0]-1, coords[1]
-            elif direction == "s":
-                yield coords[0]+1, coords[1]
-            elif direction == "w":
-                yield coords[0], coords[1]+1
-            else:
-                yield coords[0], coords[1]-1
+            shift = cls.EXIT_SHIFTS[cls.EXIT_CODES.get(direction, 3)]
+            yield coords[0] + int(shift[0]), coords[1] + int(shift[1])
 
     @classmethod
     def _graph_to_array(cls, graph: dict, dimensions: tuple,
-                        start: dict, finish: dict) -> (list, tuple):
+                        start: dict, finish: dict) -> (np.ndarray, tuple):
         """Convert the API graph to an array.
 
+        Coordinates of all nodes and exits are gathered into index arrays
+        first, then passages are carved with two fancy-indexed assignments.
         :param graph: API graph (displays connections between neighbour nodes)
         :param dimensions: dimensions of the API maze
         :param start: API start coordinates
@@ -143,126 +176,251 @@ class Maze:
         :return: a tuple of array itself and its scaled size
         """
         size = cls._scale(*dimensions, adder=1)
-        array = [[1 for i in range(size[0])] for ii in range(size[1])]
-        for node in graph:
-            coords = cls._get_coords(node["coordinates"])
-            array[coords[0]][coords[1]] = 0
-            for near in cls._get_node_neighbours(node):
-                array[near[0]][near[1]] = 0
+        array = np.ones((size[1], size[0]), dtype=np.uint8)
+        y_x = itemgetter("y", "x")
+        nodes = np.fromiter(chain.from_iterable(
+            map(y_x, map(itemgetter("coordinates"), graph))
+        ), dtype=np.intp).reshape(-1, 2)
+        exits = [node["exits"] for node in graph]
+        nears = np.fromiter(chain.from_iterable(
+            y_x(near) for node_exits in exits for near in node_exits.values()
+        ), dtype=np.intp).reshape(-1, 2)
+        directions = np.fromiter((cls.EXIT_CODES.get(direction, 3)
+                                  for node_exits in exits
+                                  for direction in node_exits),
+                                 dtype=np.intp)
+        nodes = 2 * (nodes - 1)
+        nears = 2 * (nears - 1) + cls.EXIT_SHIFTS[directions]
+        array[nodes[:, 0], nodes[:, 1]] = 0
+        array[nears[:, 0], nears[:, 1]] = 0
         start = cls._get_coords(start)
         finish = cls._get_coords(finish)
-        array[start[0]][start[1]] = cls.START
-        array[finish[0]][finish[1]] = cls.END
+        array[start] = cls.START
+        array[finish] = cls.END
         return array, size
 
+    @classmethod
+    def from_graph(cls, name: str, graph: dict,
+                   algo: str = "Recursive Backtracker",
+                   dimensions: tuple = None) -> Maze:
+        """Build a maze from an API graph.
+
+        :param name: name of the maze
+        :param graph: API graph
+        :param algo: algorithm of the graph
+        :param dimensions: dimensions of the graph (the graph's own if None)
+        :return: a Maze() instance
+        """
+        if dimensions is None:
+            dimensions = (int(graph["dimensions"]["width"]),
+                          int(graph["dimensions"]["height"]))
+        array, size = cls._graph_to_array(graph["cellMap"], dimensions,
+                                          graph["start"], graph["end"])
+        size_str = "x".join(map(lambda x: str(x+1), size))
+
+        return cls(name=name, size=size, array=array, algo=algo,
+                   size_str=size_str)
+
+    @staticmethod
+    def _check_dimensions(dimensions: tuple) -> tuple:
+        """Get the dimensions or the default ones if the API rejects them."""
+        dimensions = tuple(map(int, dimensions))
+        if not all(map(lambda x: isinstance(x, int) and x >= 5,
+                       dimensions)):
+            dimensions = (10, 10)
+        return dimensions
+
     @classmethod
     def from_api(cls, name: str, dimensions: tuple = (10, 10),
                  algo: str = "Recursive Backtracker",
-                 solution_len: int = None, maze_id=None):
+                 solution_len: int = None, maze_id=None,
+                 client: MazeAPIClient = None) -> Maze:
         """Get a single maze with the given parameters from the API.
 
         :param dimensions: dimensions of the graph
         :param algo: algorithm of the graph
         :param solution_len: length of the solution
         :param maze_id: an id of a specific generated maze
+        :param client: API client (the shared one if None)
         :return:a Maze() instance from API
         :exception MazeConstructionError: change dimensions or solution length
+        :exception MazeAPIError: the API is unavailable
         """
+        client = client or default_client()
         if maze_id:
-            maze_url = f"https://maze-api.herokuapp.com/api/mazes/{maze_id}"
-            graph = requests.get(maze_url).json()
-            dimensions = graph["dimensions"]
-            dimensions = (int(dimensions["width"]),
-                          int(dimensions["height"]))
+            graph = client.get_graph(maze_id)
         else:
-            dimensions = tuple(map(int, dimensions))
-            if not all(map(lambda x: isinstance(x, int) and x >= 5,
-                           dimensions)):
-                dimensions = (10, 10)
-            params = {
-                "number": 1,
-                "width": dimensions[0],
-                "height": dimensions[1],
-                "algorithm": algo.replace(" ", "%20")
-                if algo in ("Prims", "Woven", "Growing Tree") else
-                "Recursive%20Backtracker",
-                "cellShape": "Square",
-                "solutionLength": solution_len if solution_len and
-                algo in ("Prims", "Growing Tree") else None
-            }
-            # compose all parameters in a single GET request
-            maze_pars = '&'.join(
-                map(lambda x: f'{x}={params[x]}',
-                    filter(lambda y: True if params[y] is not None else False,
-                           params))
-            )
-            maze_url = (f"https://maze-api.herokuapp.com/api/mazes/?"
-                        f"{maze_pars}")
-            try:
-                graph = requests.get(maze_url).json()[0]
-            except IndexError:
+            dimensions = cls._check_dimensions(dimensions)
+            graph = next(client.iter_graphs(dimensions, algo, solution_len),
+                         None)
+            if graph is None:
                 raise MazeConstructionError(dimensions, solution_len)
+            return cls.from_graph(name, graph, algo, dimensions)
+        return cls.from_graph(name, graph, algo)
 
-        array, size = cls._graph_to_array(graph["cellMap"], dimensions,
-                                          graph["start"], graph["end"])
-        size_str = "x".join(map(lambda x: str(x+1), size))
+    @classmethod
+    def bulk_from_api(cls, name: str, number: int,
+                      dimensions: tuple = (10, 10),
+                      algo: str = "Recursive Backtracker",
+                      solution_len: int = None,
+                      client: MazeAPIClient = None) -> Iterator[Maze]:
+        """Generate mazes fetched from the API in a single request.
+
+        Graphs are converted as they arrive, mazes are named
+        <name>_<number in the response>.
+        :param name: base name of the mazes
+        :param number: number of mazes
+        :param dimensions: dimensions of the graphs
+        :param algo: algorithm of the graphs
+        :param solution_len: length of the solution
+        :param client: API client (the shared one if None)
+        :return: generator of Maze() instances
+        :exception MazeAPIError: the API is unavailable
+        """
+        client = client or default_client()
+        dimensions = cls._check_dimensions(dimensions)
+        graphs = client.iter_graphs(dimensions, algo, solution_len, number)
+        for index, graph in enumerate(graphs):
+            yield cls.from_graph(f"{name}_{index}", graph, algo, dimensions)
 
-        return cls(name=name, size=size, array=array, algo=algo,
-                   size_str=size_str)
+    @staticmethod
+    def _path_to_array(route: Collection) -> np.ndarray:
+        """Convert a route (collection of coordinates) to an (n, 2) array."""
+        return np.array(sorted(route), dtype=np.int32).reshape(-1, 2)
 
-    def save_to_database(self) -> dict:
+    @staticmethod
+    def _array_to_path(array: np.ndarray) -> tuple:
+        """Convert an (n, 2) array back to a tuple of coordinates."""
+        return tuple(map(tuple, array.reshape(-1, 2).tolist()))
+
+    def _write_data(self, path: Path) -> dict:
+        """Write the maze data in the binary format.
+
+        A small JSON header describes the maze, the grid and both routes
+        are stored as raw .npy arrays. The header is written last, so its
+        presence marks a complete record.
+        :param path: path to the maze directory
+        :return: the header
+        """
+        q_data = dict(self.q_data)
+        solution_path = q_data.pop("solution_path", ())
+        np.save(path / "array.npy", self.array)
+        np.save(path / "optimal_route.npy",
+                self._path_to_array(self.optimal_route))
+        np.save(path / "solution_path.npy",
+                self._path_to_array(solution_path))
+        header = {"format": self.FORMAT_VERSION,
+                  "name": self.name,
+                  "q_data": q_data,
+                  "metrics": self.metrics,
+                  "size": self.size,
+                  "start": self.start,
+                  "finish": self.finish,
+                  "algo": self.algo,
+                  "size_str": self.size_str}
+        with open(path / "header.json", encoding="utf-8", mode="w+") as f:
+            json.dump(header, f)
+        return header
+
+    @classmethod
+    def _read_data(cls, path: Path) -> dict:
+        """Read the maze data in the binary format.
+
+        The grid is memory-mapped instead of being read into memory.
+        :param path: path to the maze directory
+        :return: keyword arguments for the maze
+        """
+        with open(path / "header.json", encoding="utf-8") as f:
+            json_data = json.load(f)
+        version = json_data.pop("format")
+        if version > cls.FORMAT_VERSION:
+            raise MazeFormatError(f"unsupported format version {version}")
+        json_data["array"] = np.load(path / "array.npy", mmap_mode="r")
+        json_data["optimal_route"] = set(cls._array_to_path(
+            np.load(path / "optimal_route.npy", mmap_mode="r")
+        ))
+        json_data["q_data"]["solution_path"] = cls._array_to_path(
+            np.load(path / "solution_path.npy", mmap_mode="r")
+        )
+        return json_data
+
+    def save_to_database(self, database: str = "static/database") -> dict:
         """Save the maze to the database.
 
+        :param database: path to the database directory
         :return: a representative dictionary for sorting database
         """
         if self.optimal_route is None:
             raise MazeUnsolvableError("maze cannot be solved")
-        path = Path(f"static/database/{self.name}")
+        path = Path(database) / self.name
         try:
             os.mkdir(path)
         except OSError:
             "already exists"
         if self.img is not None:
             self.img.save(path / "img.jpg")
-        json_data = {"name": self.name,
-                     "q_data": self.q_data,
-                     "size": self.size,
-                     "array": self.array,
-                     "optimal_route": tuple(self.optimal_route),
-                     "start": self.start,
-                     "finish": self.finish,
-                     "algo": self.algo,
-                     "size_str": self.size_str}
-        with open(path / "data.json", encoding="utf-8", mode="w+") as f:
-            json.dump(json_data, f, indent=4)
-        json_data.pop("name")
-        final_q = json_data.pop("q_data")
-        dict_repr = {"name": self.name,
-                     "parameters": json_data,
-                     "image": f"../static/database/{path.name}/img.jpg"}
-        dict_repr["parameters"].update(final_q)
-        for key in ("size", "array", "optimal_route", "solution_path"):
-            dict_repr["parameters"].pop(key)
-
+        header = self._write_data(path)
+        dict_repr = self.list_entry()
+        dict_repr["parameters"].update(header["q_data"])
         dict_repr["parameters"]["route_len"] = len(
             self.q_data["solution_path"]
         )
-
+        dict_repr["image"] = f"../static/database/{path.name}/img.jpg"
         return dict_repr
 
+    def list_entry(self) -> dict:
+        """Get the representation of the maze before its training.
+
+        It can be sorted by the metrics only and has no image.
+        :return: a representative dictionary for sorting database
+        """
+        parameters = {"start": self.start,
+                      "finish": self.finish,
+                      "algo": self.algo,
+                      "size_str": self.size_str}
+        parameters.update(self.metrics)
+        return {"name": self.name, "parameters": parameters, "image": None}
+
     def _find_optimal_route(self):
-        """Use A* to find optimal route as a set."""
-        self.optimal_route = AStarSearcher(self).search_path()
+        """Find optimal route as a set from the cached distance field."""
+        self.optimal_route = DISTANCE_CACHE.solver(self).optimal_path()
+
+    def find_optimal_route(self):
+        """Find the optimal route unless it is already known.
 
-    def find_q_data(self):
-        """Train a QAgent to solve the maze and gather desired information."""
+        :exception MazeUnsolvableError: the maze has no route
+        """
         if not self.optimal_route:
             self._find_optimal_route()
         if self.optimal_route is None:
             raise MazeUnsolvableError("maze cannot be solved")
+
+    def find_metrics(self):
+        """Measure the difficulty of the maze with the exact solver."""
+        self.metrics = DISTANCE_CACHE.solver(self).metrics()
+
+    def find_q_data(self, draw: bool = True, learning_rate: float = None,
+                    discount: float = None, warm_start: bool = False,
+                    distances: np.ndarray = None):
+        """Train a Q learner to solve the maze and gather desired information.
+
+        :param draw: whether to draw the solution image
+        :param learning_rate: learning rate (the maze's one if None)
+        :param discount: discount rate (the maze's one if None)
+        :param warm_start: whether to start from the shortest routes prior
+        :param distances: distance field of the grid for the prior
+        """
+        if learning_rate is not None:
+            self.learning_rate = learning_rate
+        if discount is not None:
+            self.discount = discount
+        self.find_optimal_route()
         qlearner = QLearner(self)
-        self.q_data = qlearner.train_env(self.learning_rate, self.discount)
-        self.img = QLearner(self).draw_maze(self.q_data["solution_path"])
+        self.q_data = qlearner.train_env(self.learning_rate, self.discount,
+                                         warm_start=warm_start,
+                                         distances=distances)
+        if draw:
+            self.img = qlearner.draw_maze(self.q_data["solution_path"])
         # number of all different coordinates in two paths
         self.q_data["difference"] = len(
             (self.q_data["solution_path"] | self.optimal_route) -
@@ -270,21 +428,38 @@ class Maze:
         )
         self.q_data["solution_path"] = tuple(self.q_data["solution_path"])
 
+    def draw_solution(self):
+        """Draw the maze with the Q Learning solution path."""
+        self.img = QLearner(self).draw_maze(self.q_data["solution_path"])
+
     @classmethod
     def read_from_database(cls, path: str) -> Maze:
         """Get a maze from the database.
 
+        Reads both the binary format and the former data.json one.
         :param path: path to the maze directory
         :return: a maze object with appropriate parameters
         """
+        from PIL import Image
         path = Path(path)
         try:
             img = Image.open(path / "img.jpg")
         except FileNotFoundError:
             img = None
-        with open(path / "data.json", encoding="utf-8") as f:
-            json_data = json.load(f)
-        return cls(img=img, **json_data)
+        if (path / "header.json").exists():
+            json_data = cls._read_data(path)
+        else:
+            with open(path / "data.json", encoding="utf-8") as f:
+                json_data = json.load(f)
+            if json_data.get("optimal_route") is not None:
+                json_data["optimal_route"] = {
+                    tuple(cell) for cell in json_data["optimal_route"]
+                }
+        # stored names carry the hyperparameters after the base name
+        name = json_data.pop("name")
+        maze = cls(name=name.split("-")[0], img=img, **json_data)
+        maze.name = name
+        return maze
 
     def __repr__(self) -> str:
         result_str = ""
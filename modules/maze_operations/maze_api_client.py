@@ -0,0 +1,249 @@
+"""Fetch maze graphs from the Maze API over pooled connections.
+
+requests is imported on the first request, so importing the client does
+not slow down the app or the training workers.
+"""
+import json
+import re
+import threading
+from typing import Iterable, Iterator
+
+API_URL = "https://maze-api.herokuapp.com/api/mazes/"
+ALGORITHMS = ("Prims", "Woven", "Growing Tree")
+# complete strings, the quote of an unfinished one and brackets
+_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|["\[\]{}]')
+
+
+class MazeAPIError(Exception):
+    """Indicates that the Maze API could not be reached or answered badly."""
+    pass
+
+
+def _decode(text: str):
+    """Decode a complete item of the array."""
+    try:
+        return json.loads(text)
+    except ValueError as err:
+        raise MazeAPIError(f"invalid item in the JSON array: {err}") \
+            from err
+
+
+def _decode_scalars(text: str) -> Iterator:
+    """Decode the numbers and literals between the items of the array."""
+    for part in text.split(","):
+        part = part.strip()
+        if part:
+            yield _decode(part)
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    """Decode the items of a JSON array as its text arrives.
+
+    Only the new text is scanned for brackets and strings, every item is
+    decoded once when it is complete.
+
+    :param chunks: consecutive pieces of the array text
+    :return: generator of the decoded items
+    :exception MazeAPIError: the text is not a JSON array
+    """
+    buffer = ""
+    pending = []  # scanned text of the unfinished item
+    scan = 0  # where the search for tokens continues
+    mark = 0  # start of the text that is not decoded yet
+    depth = 0  # bracket depth, the array itself is at 1
+    for chunk in chunks:
+        buffer = buffer[mark:] + chunk
+        scan -= mark
+        mark = 0
+        if depth == 0:
+            text = buffer.lstrip()
+            if not text:
+                continue
+            if text[0] != "[":
+                raise MazeAPIError("expected a JSON array of mazes")
+            depth = 1
+            mark = scan = len(buffer) - len(text) + 1
+        for match in _TOKENS.finditer(buffer, scan):
+            token = match.group()
+            if token == '"':
+                # the string goes on in the next chunk
+                break
+            scan = match.end()
+            if token[0] == '"':
+                if depth == 1:
+                    yield from _decode_scalars(buffer[mark:match.start()])
+                    yield _decode(token)
+                    mark = scan
+            elif token in "[{":
+                if depth == 1:
+                    yield from _decode_scalars(buffer[mark:match.start()])
+                    mark = match.start()
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    pending.append(buffer[mark:scan])
+                    yield _decode("".join(pending))
+                    pending.clear()
+                    mark = scan
+                elif depth == 0:
+                    yield from _decode_scalars(buffer[mark:match.start()])
+                    return
+        if depth > 1:
+            # keep the scanned part aside, so it is not copied again
+            pending.append(buffer[mark:scan])
+            mark = scan
+    raise MazeAPIError("the JSON array was cut off")
+
+
+class MazeAPIClient:
+    """Client of the Maze API reusing connections between requests.
+
+    Failed connections and responses with a retryable status are retried
+    with exponential backoff; every request has a timeout.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url: str = API_URL, timeout: tuple = (3.05, 30),
+                 retries: int = 3, backoff: float = 0.5,
+                 pool_size: int = 10, chunk_size: int = 16384):
+        """Create a new client.
+
+        :param base_url: URL of the mazes collection (ends with /)
+        :param timeout: connect and read timeouts in seconds
+        :param retries: attempts after the first failed one
+        :param backoff: backoff factor of the retries in seconds
+        :param pool_size: connections kept open to the API
+        :param chunk_size: bytes read at once from streamed responses
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Get the pooled session (created on first use).
+
+        :rtype: requests.Session
+        """
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                settings = {"total": self.retries,
+                            "backoff_factor": self.backoff,
+                            "status_forcelist": self.RETRY_STATUSES,
+                            "raise_on_status": False}
+                try:
+                    retry = Retry(allowed_methods=("GET",), **settings)
+                except TypeError:
+                    # urllib3 before 1.26 (as pinned in requirements.txt)
+                    retry = Retry(method_whitelist=("GET",), **settings)
+                adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                      pool_maxsize=self.pool_size,
+                                      max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+        return self._session
+
+    @staticmethod
+    def build_query(dimensions: tuple, algo: str, solution_len: int = None,
+                    number: int = 1) -> str:
+        """Compose the query string of a request for new mazes.
+
+        :param dimensions: dimensions of the graphs
+        :param algo: algorithm of the graphs
+        :param solution_len: length of the solution
+        :param number: number of mazes
+        :return: the query string
+        """
+        params = {
+            "number": number,
+            "width": dimensions[0],
+            "height": dimensions[1],
+            "algorithm": algo.replace(" ", "%20") if algo in ALGORITHMS
+            else "Recursive%20Backtracker",
+            "cellShape": "Square",
+            "solutionLength": solution_len if solution_len and
+            algo in ("Prims", "Growing Tree") else None
+        }
+        return "&".join(f"{key}={value}" for key, value in params.items()
+                        if value is not None)
+
+    def _get(self, url: str, stream: bool = False):
+        """Send a GET request and check its status.
+
+        :rtype: requests.Response
+        :exception MazeAPIError: the request failed
+        """
+        import requests
+        try:
+            response = self.session.get(url, timeout=self.timeout,
+                                        stream=stream)
+            response.raise_for_status()
+        except requests.RequestException as err:
+            raise MazeAPIError(f"request to {url} failed: {err}") from err
+        return response
+
+    def get_graph(self, maze_id: str) -> dict:
+        """Get the graph of a specific generated maze.
+
+        :param maze_id: id of the maze
+        :return: the graph
+        """
+        response = self._get(f"{self.base_url}{maze_id}")
+        try:
+            return response.json()
+        except ValueError as err:
+            raise MazeAPIError("the maze is not valid JSON") from err
+
+    def iter_graphs(self, dimensions: tuple, algo: str,
+                    solution_len: int = None,
+                    number: int = 1) -> Iterator[dict]:
+        """Generate graphs of new mazes as the response streams in.
+
+        :param dimensions: dimensions of the graphs
+        :param algo: algorithm of the graphs
+        :param solution_len: length of the solution
+        :param number: number of mazes to request at once
+        :return: generator of the graphs
+        """
+        import requests
+        query = self.build_query(dimensions, algo, solution_len, number)
+        response = self._get(f"{self.base_url}?{query}", stream=True)
+        response.encoding = response.encoding or "utf-8"
+        try:
+            with response:
+                yield from iter_json_array(response.iter_content(
+                    self.chunk_size, decode_unicode=True
+                ))
+        except requests.RequestException as err:
+            raise MazeAPIError(f"reading mazes failed: {err}") from err
+
+    def close(self):
+        """Close the pooled connections."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> MazeAPIClient:
+    """Get the client shared by the whole process."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = MazeAPIClient()
+    return _default_client
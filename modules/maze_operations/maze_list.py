@@ -1,90 +1,404 @@
 """Work with a maze list for representing all sortable mazes."""
+import copy
 import json
+import os
+import threading
+import time
+from bisect import bisect_left, insort
 from threading import Lock
 from typing import Collection
 
 
+class MazesSnapshot:
+    """An immutable version of the maze list with its indexes.
+
+    Readers work with a snapshot without locking. Writers never change a
+    published snapshot; they build the next one, copying only the index
+    parts that change, and publish it with a single assignment.
+    """
+
+    def __init__(self, mazes: tuple, sort_values: dict, indexes: dict,
+                 inverted: dict, names: frozenset, positions: dict,
+                 pending: frozenset, version: int, modified: float):
+        """Create a new snapshot.
+
+        :param mazes: maze representations in insertion order
+        :param sort_values: sort value of every position for every key
+        :param indexes: sorted (sort value, position) pairs for every key
+        :param inverted: positions of the mazes having a parameter or value
+        :param names: base names of the mazes, including reserved ones
+        :param positions: position of every maze by its full name
+        :param pending: full names of the mazes that are not stored yet
+        :param version: number of the version (grows with every change)
+        :param modified: time the version was made
+        """
+        self.mazes = mazes
+        self.sort_values = sort_values
+        self.indexes = indexes
+        self.inverted = inverted
+        self.names = names
+        self.positions = positions
+        self.pending = pending
+        self.version = version
+        self.modified = modified
+        # query results are valid for the whole life of the snapshot
+        self._cache = {}
+
+    def _query(self, key: str, filters: Collection) -> list:
+        """Get mazes matching at least one filter sorted by key.
+
+        Without filters the sorted index is read as is, otherwise only the
+        matching mazes are sorted.
+        """
+        if not filters:
+            return [self.mazes[pos] for _, pos in self.indexes[key]]
+        matching = set()
+        for filt in filters:
+            matching |= self.inverted.get(filt, set())
+        sort_values = self.sort_values[key]
+        return [self.mazes[pos] for pos in
+                sorted(matching & sort_values.keys(),
+                       key=lambda pos: (sort_values[pos], pos))]
+
+    def query(self, key: str, filters: Collection) -> list:
+        """Get the cached result of a query (do not modify it)."""
+        query = (key, frozenset(filters))
+        result = self._cache.get(query)
+        if result is None:
+            # racing readers may both compute it, the results are equal
+            result = self._cache[query] = self._query(key, filters)
+        return result
+
+
 class MazesList:
     """Represent a collection of all sortable mazes."""
     keys_to_reversed = {
         "max_reward": True,
         "solution episode": False,
         "difference": False,
-        "route_len": False
+        "route_len": False,
+        "shortest_len": False,
+        "dead_ends": False
     }
 
     def __init__(self, options_filename: str = "static/database/options.json",
-                 list_filename: str = "static/database/mazes_list.json"):
+                 list_filename: str = "static/database/mazes_list.json",
+                 compact_every: int = 1000):
         """Load a new sequence from the database.
 
+        The list is stored as a list file and a journal of JSON lines with
+        the mazes added after it.
         :param options_filename: path for web options
         :param list_filename: path for already stored maze representations
+        :param compact_every: journal length that triggers a compaction
         """
+        # serializes writers, readers never take it
         self.lock = Lock()
+        self._compact_lock = Lock()
         with open(options_filename, encoding="utf-8") as opt_f:
             options_dct = json.load(opt_f)
         for key in options_dct:
             self.__dict__[key] = options_dct[key]
         with open(list_filename, encoding="utf-8") as list_f:
-            self.mazes_list = json.load(list_f)
+            mazes = json.load(list_f)
         self.list_filename = list_filename
-        self._names = None
+        self.journal_filename = os.path.splitext(list_filename)[0] + ".jsonl"
+        self.compact_every = compact_every
+        self._journal_len = self._replay_journal(mazes)
+        self._compacting = False
+        # time of the last change, the stored files' one after loading
+        modified = max(os.path.getmtime(filename) for filename in
+                       (list_filename, self.journal_filename)
+                       if os.path.exists(filename))
+        self._snapshot = self._build_snapshot(mazes, modified)
+
+    def _replay_journal(self, mazes: list) -> int:
+        """Append mazes from the journal to the loaded ones.
+
+        :param mazes: mazes loaded from the list file
+        :return: number of entries in the journal
+        """
+        try:
+            with open(self.journal_filename, encoding="utf-8") as journal_f:
+                lines = journal_f.readlines()
+        except FileNotFoundError:
+            return 0
+        # entries may already be in the list file after an interrupted
+        # compaction, the last line may be cut short by a crash
+        positions = {elem["name"]: pos for pos, elem in enumerate(mazes)}
+        for line in lines:
+            try:
+                elem = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            pos = positions.setdefault(elem["name"], len(mazes))
+            if pos == len(mazes):
+                mazes.append(elem)
+            else:
+                mazes[pos] = elem
+        return len(lines)
 
     def get_context(self) -> dict:
         """Get context for web page."""
         return self.__dict__
 
+    def snapshot(self) -> MazesSnapshot:
+        """Get the current version of the list, it never changes."""
+        return self._snapshot
+
+    @property
+    def mazes_list(self) -> tuple:
+        """Get all maze representations in insertion order."""
+        return self._snapshot.mazes
+
+    @property
+    def version(self) -> int:
+        """Get the number of the current version."""
+        return self._snapshot.version
+
+    @property
+    def modified(self) -> float:
+        """Get the time of the last change."""
+        return self._snapshot.modified
+
+    @staticmethod
+    def _base_name(elem: dict) -> str:
+        """Get the maze name without the hyperparameters."""
+        return elem["name"].split("-")[0]
+
+    def _sort_value(self, elem: dict, key: str):
+        """Get the value ordering the maze by key in ascending order."""
+        value = elem["parameters"][key]
+        return -value if self.keys_to_reversed[key] else value
+
     @staticmethod
-    def _filter_condition(elem: dict, filters: Collection) -> bool:
-        """Filter through conditions.
+    def _filter_values(elem: dict) -> list:
+        """Get parameter names and hashable values the maze is found by."""
+        values = []
+        for key, value in elem["parameters"].items():
+            values.append(key)
+            try:
+                hash(value)
+            except TypeError:
+                "unhashable values (coordinates) cannot be filtered by"
+            else:
+                values.append(value)
+        return values
+
+    def _build_snapshot(self, mazes: list, modified: float,
+                        names: frozenset = frozenset(),
+                        pending: frozenset = frozenset(),
+                        version: int = 0) -> MazesSnapshot:
+        """Build a snapshot with all indexes from scratch.
 
-        :param elem: current maze
-        :param filters: a collection of all filters
-        :return: True if at least one filter works, False otherwise
+        A sorted index holds (sort value, position) pairs, so equal values
+        keep the insertion order. The filter index maps every parameter
+        name and value to positions of the mazes having it.
+        :param names: reserved base names besides the mazes' ones
+        :param pending: full names of the mazes that are not stored yet
+        :param version: number of the version
         """
-        for filt in filters:
-            if filt in elem.keys() or filt in elem.values():
-                return True
-        return False
+        sort_values = {key: {} for key in self.keys_to_reversed}
+        inverted = {}
+        for pos, elem in enumerate(mazes):
+            for value in self._filter_values(elem):
+                inverted.setdefault(value, set()).add(pos)
+            for key in self.keys_to_reversed:
+                if key in elem["parameters"]:
+                    sort_values[key][pos] = self._sort_value(elem, key)
+        indexes = {key: sorted((value, pos) for pos, value in
+                               sort_values[key].items())
+                   for key in self.keys_to_reversed}
+        names = names | frozenset(map(self._base_name, mazes))
+        positions = {elem["name"]: pos for pos, elem in enumerate(mazes)}
+        return MazesSnapshot(tuple(mazes), sort_values, indexes, inverted,
+                             names, positions, pending, version, modified)
+
+    def _next_snapshot(self, elem: dict,
+                       pending: bool = False) -> MazesSnapshot:
+        """Build the snapshot following the current one with the maze.
+
+        A maze with the name of a listed one replaces it in place. Must be
+        called with the lock held. Index parts the maze does not touch are
+        shared with the current snapshot.
+        :param pending: whether the maze is not stored yet
+        """
+        current = self._snapshot
+        name = elem["name"]
+        pos = current.positions.get(name)
+        if pos is None:
+            pos = len(current.mazes)
+            old = {"parameters": {}}
+            mazes = current.mazes + (elem,)
+            positions = dict(current.positions)
+            positions[name] = pos
+        else:
+            old = current.mazes[pos]
+            mazes = current.mazes[:pos] + (elem,) + current.mazes[pos + 1:]
+            positions = current.positions
+        sort_values = dict(current.sort_values)
+        indexes = dict(current.indexes)
+        for key in self.keys_to_reversed:
+            if key not in elem["parameters"] and \
+                    key not in old["parameters"]:
+                continue
+            sort_values[key] = dict(sort_values[key])
+            indexes[key] = list(indexes[key])
+            if key in old["parameters"]:
+                value = sort_values[key].pop(pos)
+                del indexes[key][bisect_left(indexes[key], (value, pos))]
+            if key in elem["parameters"]:
+                value = self._sort_value(elem, key)
+                sort_values[key][pos] = value
+                insort(indexes[key], (value, pos))
+        inverted = dict(current.inverted)
+        for value in self._filter_values(old):
+            inverted[value] = inverted[value] - {pos}
+        for value in self._filter_values(elem):
+            inverted[value] = inverted.get(value, set()) | {pos}
+        pending_names = current.pending | {name} if pending else \
+            current.pending - {name}
+        return MazesSnapshot(mazes, sort_values, indexes, inverted,
+                             current.names | {self._base_name(elem)},
+                             positions, pending_names, current.version + 1,
+                             time.time())
 
     def sort_by_key(self, filters: dict) -> Collection:
         """Sort filtered mazes by key.
 
+        Results are cached for every version of the list.
         :param filters: key and filters
         :return: a sorted collection
         """
         # pop the key
         key = filters.pop("sort_option")
+        return list(self._snapshot.query(key, filters))
+
+    def sort_page(self, filters: dict, page: int = 1,
+                  limit: int = 20) -> (list, int):
+        """Get a page of filtered mazes sorted by key.
+
+        :param filters: key and filters
+        :param page: number of the page (from 1)
+        :param limit: number of mazes on a page
+        :return: mazes of the page and the number of all matching mazes
+        """
+        key = filters.pop("sort_option")
+        start = (page - 1) * limit
+        mazes = self._snapshot.query(key, filters)
+        return mazes[start:start + limit], len(mazes)
+
+    @staticmethod
+    def _write_atomic(filename: str, lines: Collection):
+        """Replace the file with the lines, never leaving it half-written."""
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, mode="w", encoding="utf-8") as tmp_f:
+            tmp_f.writelines(lines)
+            tmp_f.flush()
+            os.fsync(tmp_f.fileno())
+        os.replace(tmp_filename, filename)
+
+    def add(self, elem: dict):
+        """Add a maze representation and append it to the journal.
+
+        A pending maze with the same name is replaced. The new version is
+        published once the journal entry is written.
+        :param elem: representative dictionary of the maze
+        """
+        line = json.dumps(elem) + "\n"
+        with self.lock:
+            snapshot = self._next_snapshot(elem)
+            with open(self.journal_filename, mode="a",
+                      encoding="utf-8") as journal_f:
+                journal_f.write(line)
+                journal_f.flush()
+                os.fsync(journal_f.fileno())
+            self._snapshot = snapshot
+            self._journal_len += 1
+            compact = (self._journal_len >= self.compact_every and
+                       not self._compacting)
+            if compact:
+                self._compacting = True
+        if compact:
+            threading.Thread(target=self.save, daemon=True).start()
+
+    def publish(self, elem: dict):
+        """Show a maze that is not stored yet, e.g. before its training.
+
+        The maze can be sorted and filtered by the parameters it has until
+        ``add`` replaces it. It is never written to the database.
+        :param elem: representative dictionary of the maze
+        """
+        with self.lock:
+            self._snapshot = self._next_snapshot(elem, pending=True)
+
+    def withdraw(self, name: str):
+        """Remove the pending mazes with the base name (e.g. on failure).
+
+        The name is released unless a maze with it is already stored, so
+        the maze can be submitted again.
+        :param name: base name of the mazes
+        """
         with self.lock:
-            if not filters:
-                return sorted(self.mazes_list,
-                              key=lambda x: x["parameters"][key],
-                              reverse=self.keys_to_reversed[key])
-            filtered = filter(lambda x: self._filter_condition(x["parameters"],
-                                                               filters),
-                              self.mazes_list)
-        return sorted(filtered, key=lambda x: x["parameters"][key],
-                      reverse=self.keys_to_reversed[key])
+            current = self._snapshot
+            withdrawn = {full for full in current.pending
+                         if full.split("-")[0] == name}
+            mazes = [elem for elem in current.mazes
+                     if elem["name"] not in withdrawn]
+            if withdrawn:
+                # stored mazes keep their names when the snapshot is built
+                self._snapshot = self._build_snapshot(
+                    mazes, time.time(), current.names - {name},
+                    current.pending - withdrawn, current.version + 1
+                )
+            elif name in current.names and not any(
+                    self._base_name(elem) == name for elem in mazes):
+                snapshot = copy.copy(current)
+                snapshot.names = current.names - {name}
+                self._snapshot = snapshot
 
     def save(self):
-        """Save mazes to database."""
+        """Save mazes to database (compact the journal into the list file)."""
+        with self._compact_lock:
+            current = self._snapshot
+            saved = [elem for elem in current.mazes
+                     if elem["name"] not in current.pending]
+            self._write_atomic(self.list_filename, (json.dumps(saved),))
+            with self.lock:
+                # keep the mazes stored while the list file was written
+                saved_ids = set(map(id, saved))
+                added = [elem for elem in self._snapshot.mazes
+                         if id(elem) not in saved_ids and
+                         elem["name"] not in self._snapshot.pending]
+                self._write_atomic(self.journal_filename,
+                                   [json.dumps(elem) + "\n" for elem in added])
+                self._journal_len = len(added)
+                self._compacting = False
+
+    def reserve_name(self, name: str) -> bool:
+        """Reserve a base name for a maze unless it is already taken.
+
+        Checking and reserving is a single step, so two threads can never
+        reserve the same name.
+        :param name: base name of the maze
+        :return: whether the name was free and is now reserved
+        """
         with self.lock:
-            with open(self.list_filename,
-                      mode="w+", encoding="utf-8") as list_f:
-                json.dump(self.mazes_list, list_f)
+            current = self._snapshot
+            if name in current.names:
+                return False
+            # the mazes and the cached queries stay the same
+            snapshot = copy.copy(current)
+            snapshot.names = current.names | {name}
+            self._snapshot = snapshot
+            return True
 
     @property
-    def names(self) -> set:
-        """Get all mazes' names."""
-        if self._names:
-            return self._names
-        self._names = set(map(lambda x: x["name"].split("-")[0],
-                              self.mazes_list))
-        return self._names
+    def names(self) -> frozenset:
+        """Get all mazes' names (including reserved ones)."""
+        return self._snapshot.names
 
     @names.setter
     def names(self, value: str):
         """Add a new name to names."""
-        if self._names is None:
-            pass
-        self._names.add(value)
+        self.reserve_name(value)
@@ -0,0 +1,192 @@
+"""Solve a maze exactly with BFS and measure its difficulty."""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+
+class MazeSolver:
+    """Deterministic baseline solver of a maze grid.
+
+    A breadth-first search from the finish gives the number of moves to it
+    from every cell, the shortest path and the difficulty metrics follow
+    from this distance field and from the numbers of open neighbours.
+    """
+    allowed_moves = np.array(((0, -1), (0, 1), (-1, 0), (1, 0)))
+
+    def __init__(self, maze):
+        """Create a new solver based on a maze.
+
+        :param maze: maze to base upon
+        :type maze: Maze
+        """
+        self.array = np.asarray(maze.array)
+        self.start = maze.start
+        self.finish = maze.finish
+        self.open = self.array != 1
+        self._distances = None
+
+    def _neighbours(self) -> np.ndarray:
+        """Get flat indexes of the neighbours of every cell.
+
+        :return: (cells x 4) table, the cell itself for walls and borders
+        """
+        rows, cols = self.array.shape
+        cells = np.arange(self.array.size)[:, None]
+        new_i = cells // cols + self.allowed_moves[:, 0]
+        new_ii = cells % cols + self.allowed_moves[:, 1]
+        inside = (new_i >= 0) & (new_i < rows) & (new_ii >= 0) & \
+                 (new_ii < cols)
+        targets = new_i.clip(0, rows - 1) * cols + new_ii.clip(0, cols - 1)
+        blocked = ~inside | ~self.open.reshape(-1)[targets]
+        return np.where(blocked, cells, targets)
+
+    @property
+    def distances(self) -> np.ndarray:
+        """Get the number of moves to the finish from every cell.
+
+        The search advances a whole frontier of cells per step.
+        :return: grid of distances (-1 for walls and unreachable cells)
+        """
+        if self._distances is None:
+            neighbours = self._neighbours()
+            distances = np.full(self.array.size, -1, dtype=np.int32)
+            frontier = np.array([self.finish[0] * self.array.shape[1] +
+                                 self.finish[1]])
+            distances[frontier] = 0
+            depth = 0
+            while len(frontier):
+                depth += 1
+                children = np.unique(neighbours[frontier])
+                frontier = children[distances[children] == -1]
+                distances[frontier] = depth
+            self._distances = distances.reshape(self.array.shape)
+        return self._distances
+
+    def path_length(self) -> int:
+        """Get the number of moves of a shortest path (-1 if none)."""
+        return int(self.distances[tuple(self.start)])
+
+    def optimal_path(self) -> Optional[set]:
+        """Get a shortest path from the start to the finish.
+
+        :return: set of coordinates including both ends, None if the
+        finish is unreachable
+        """
+        distances = self.distances
+        pos = tuple(self.start)
+        if distances[pos] == -1:
+            return None
+        path = {pos}
+        rows, cols = distances.shape
+        while distances[pos]:
+            # a neighbour one move closer always exists
+            for i, ii in self.allowed_moves.tolist():
+                new_pos = (pos[0] + i, pos[1] + ii)
+                if (rows > new_pos[0] >= 0 and cols > new_pos[1] >= 0 and
+                        distances[new_pos] == distances[pos] - 1):
+                    pos = new_pos
+                    break
+            path.add(pos)
+        return path
+
+    def degrees(self) -> np.ndarray:
+        """Get the number of open neighbours of every open cell.
+
+        :return: grid of degrees (0 for walls)
+        """
+        padded = np.pad(self.open, 1)
+        degrees = (padded[:-2, 1:-1].astype(np.int8) + padded[2:, 1:-1] +
+                   padded[1:-1, :-2] + padded[1:-1, 2:])
+        return np.where(self.open, degrees, 0)
+
+    def metrics(self) -> dict:
+        """Get difficulty metrics of the maze.
+
+        :return: dictionary with the shortest route length in moves,
+        number of cells connected to the finish, dead ends, junctions,
+        junctions on the shortest path and mean degree of open cells
+        """
+        degrees = self.degrees()
+        ends = np.zeros_like(self.open)
+        ends[tuple(self.start)] = ends[tuple(self.finish)] = True
+        junctions = degrees >= 3
+        path = self.optimal_path()
+        if path is None:
+            shortest_len = path_junctions = -1
+        else:
+            shortest_len = self.path_length()
+            rows, cols = np.array(list(path)).T
+            path_junctions = int(junctions[rows, cols].sum())
+        return {"shortest_len": shortest_len,
+                "reachable": int((self.distances >= 0).sum()),
+                "dead_ends": int((self.open & (degrees == 1) &
+                                  ~ends).sum()),
+                "junctions": int(junctions.sum()),
+                "path_junctions": path_junctions,
+                "branching": round(float(degrees[self.open].mean()), 3)}
+
+
+class DistanceFieldCache:
+    """Keep distance fields of the last solved mazes.
+
+    Fields are keyed by the grid contents and the finish, so a maze
+    submitted again under another name is a hit. The least recently used
+    field is evicted once ``maxsize`` fields are kept.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        """Create an empty cache.
+
+        :param maxsize: number of distance fields to keep
+        """
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self._fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(maze) -> tuple:
+        """Get the cache key of a maze: grid digest, shape and finish."""
+        array = np.ascontiguousarray(maze.array, dtype=np.uint8)
+        digest = hashlib.blake2b(array.tobytes(), digest_size=16).hexdigest()
+        return digest, array.shape, tuple(maze.finish)
+
+    def solver(self, maze) -> MazeSolver:
+        """Get a solver of the maze sharing the cached distance field.
+
+        :param maze: maze to solve
+        :type maze: Maze
+        :return: a solver with its distance field computed
+        """
+        solver = MazeSolver(maze)
+        key = self.key(maze)
+        with self.lock:
+            distances = self._fields.get(key)
+            if distances is not None:
+                self._fields.move_to_end(key)
+                self.hits += 1
+        if distances is None:
+            # the search runs outside the lock
+            distances = solver.distances
+            distances.flags.writeable = False
+            with self.lock:
+                self.misses += 1
+                self._fields[key] = distances
+                while len(self._fields) > self.maxsize:
+                    self._fields.popitem(last=False)
+        solver._distances = distances
+        return solver
+
+    def clear(self):
+        """Remove all fields."""
+        with self.lock:
+            self._fields.clear()
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+
+DISTANCE_CACHE = DistanceFieldCache()
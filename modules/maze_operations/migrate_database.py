@@ -0,0 +1,40 @@
+"""Convert a maze database from data.json files to the binary format."""
+import argparse
+import os
+from pathlib import Path
+from modules.maze_operations.maze_adt import Maze
+
+
+def migrate(database: str = "static/database",
+            keep_json: bool = False) -> int:
+    """Convert every maze stored as data.json to the binary format.
+
+    :param database: path to the database directory
+    :param keep_json: whether to keep the former data.json files
+    :return: number of converted mazes
+    """
+    converted = 0
+    for data_file in sorted(Path(database).glob("*/data.json")):
+        path = data_file.parent
+        if not (path / "header.json").exists():
+            Maze.read_from_database(path)._write_data(path)
+            converted += 1
+        if not keep_json:
+            os.remove(data_file)
+    return converted
+
+
+def main():
+    """Run the migration from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("database", nargs="?", default="static/database",
+                        help="path to the database directory")
+    parser.add_argument("--keep-json", action="store_true",
+                        help="keep the former data.json files")
+    args = parser.parse_args()
+    converted = migrate(args.database, args.keep_json)
+    print(f"Converted {converted} mazes in {args.database}.")
+
+
+if __name__ == '__main__':
+    main()
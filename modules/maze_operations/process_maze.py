@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 """Work with a background processor thread."""
+import multiprocessing
 import threading
-from time import sleep
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from modules.maze_operations.maze_adt import MazeUnsolvableError
 from modules.maze_operations.maze_adt import Maze
+from modules.maze_operations.job_table import JobTable, SUBMITTED, \
+    RUNNING, DONE, FAILED, CACHED
 from modules.maze_operations.maze_list import MazesList
-from modules.helper_collections.llistqueue import Queue
+from modules.maze_operations.maze_solver import DISTANCE_CACHE
+from modules.maze_operations.result_cache import ResultCache
+from modules.helper_collections.blocking_queue import BlockingQueue
 
 
 class MazeNameExists(Exception):
@@ -13,17 +20,51 @@ class MazeNameExists(Exception):
     pass
 
 
+def train_configuration(name: str, size: tuple, array: np.ndarray,
+                        optimal_route: tuple, learning_rate: float,
+                        discount: float, warm_start: bool = False,
+                        distances: np.ndarray = None) -> dict:
+    """Train a maze for a single pair of hyperparameters.
+
+    Runs in a worker process, so it receives only the compact maze data.
+    :param name: name of the maze
+    :param size: size of the maze
+    :param array: maze grid
+    :param optimal_route: route found with A*
+    :param learning_rate: learning rate
+    :param discount: discount rate
+    :param warm_start: whether to start from the shortest routes prior
+    :param distances: distance field of the grid for the prior (the
+    worker searches for it if None)
+    :return: gathered Q Learning data
+    """
+    maze = Maze(name, size=size, array=array, optimal_route=set(optimal_route))
+    maze.find_q_data(draw=False, learning_rate=learning_rate,
+                     discount=discount, warm_start=warm_start,
+                     distances=distances)
+    return maze.q_data
+
+
 class BackgroundProcessor(threading.Thread):
     """A thread for handling maze processing."""
 
-    def __init__(self, queue: Queue, maze_list: MazesList,
-                 l_rates: tuple = (0.1, 0.3), discounts: tuple = (0.95, 0.75)):
+    def __init__(self, queue: BlockingQueue, maze_list: MazesList,
+                 l_rates: tuple = (0.1, 0.3), discounts: tuple = (0.95, 0.75),
+                 workers: int = None, warm_start: bool = False,
+                 results: ResultCache = None, jobs: JobTable = None):
         """Create a new thread.
 
         :param queue: maze queue
         :param maze_list: list of all processed mazes
         :param l_rates: learning rates to process for
         :param discounts: discount rates to process for
+        :param workers: number of worker processes for the hyperparameter
+        sweep (all CPUs if None, 0 to train in this thread)
+        :param warm_start: whether to start every configuration from the
+        shortest routes prior instead of a random Q-table
+        :param results: cache of stored training results (the one in the
+        default database if None)
+        :param jobs: table reporting the progress of queued jobs
         """
         threading.Thread.__init__(self)
         self.queue = queue
@@ -31,33 +72,170 @@ class BackgroundProcessor(threading.Thread):
         self.l_rates = l_rates
         self.discounts = discounts
         self.maze_list = maze_list
+        self.workers = workers
+        self.warm_start = warm_start
+        self.results = results if results is not None else ResultCache()
+        self.jobs = jobs if jobs is not None else JobTable()
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Get the process pool (started on first use).
+
+        Workers are not forked from this multithreaded process, they start
+        from a fork server or a fresh interpreter.
+        """
+        if self._executor is None and self.workers != 0:
+            method = "forkserver" if "forkserver" in \
+                multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context(method)
+            )
+        return self._executor
+
+    def _reset_executor(self, futures: list = ()):
+        """Shut the process pool down, the next sweep starts a new one.
+
+        :param futures: futures to cancel if they have not started yet
+        """
+        executor, self._executor = self._executor, None
+        for future in futures:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
 
     def run(self):
-        """Run the thread while the main program runs."""
+        """Run the thread until it takes the stop sentinel (None)."""
         while True:
-            if self.queue.isEmpty():
-                sleep(10)
+            item = self.queue.get()
+            if item is None:
+                break
+            # mazes may come with the id of their job
+            maze, job_id = item if isinstance(item, tuple) else (item, None)
+            try:
+                self.process_maze(maze, job_id)
+            except Exception as err:
+                # keep serving the queue after an unexpected error
+                self.jobs.finish(job_id, f"processing failed: {err}")
+                print(f"Failed to process {maze.name}: {err!r}")
+
+    def stop(self, timeout: float = None):
+        """Stop the thread after the mazes queued before.
+
+        :param timeout: seconds to wait for the thread at most
+        """
+        self.queue.push(None, block=True)
+        self.join(timeout)
+        self._reset_executor()
+
+    def _sweep(self, maze: Maze, job_id: str = None) -> list:
+        """Train the maze for every pair of hyperparameters.
+
+        Results stored for a maze with the same content are reused. The
+        configurations to train are listed by their metrics right away.
+        :param job_id: id of the job to report the progress to
+        :return: list of (learning rate, discount, q data, image) in sweep
+        order, the image is None if it has to be drawn
+        """
+        configs = [(l_rate, discount) for l_rate in self.l_rates
+                   for discount in self.discounts]
+        stored = {config: self.results.get(
+            maze.content_hash(*config, warm_start=self.warm_start)
+        ) for config in configs}
+        for stored_maze in stored.values():
+            if stored_maze is not None:
+                maze.optimal_route = stored_maze.optimal_route
+                maze.metrics = stored_maze.metrics
+        maze.find_optimal_route()
+        if not maze.metrics:
+            maze.find_metrics()
+        missing = [config for config in configs if stored[config] is None]
+        for config in configs:
+            if config not in missing:
+                self.jobs.update_config(job_id, "-".join(map(str, config)),
+                                        CACHED)
             else:
-                maze = self.queue.pop()
-                self.process_maze(maze)
+                # ranked by the metrics until its training is stored
+                entry = maze.list_entry()
+                entry["name"] = f"{maze.name}-{config[0]}-{config[1]}"
+                self.maze_list.publish(entry)
+        # the prior is based on the distance field found with the route,
+        # workers get it with the job instead of searching again
+        distances = DISTANCE_CACHE.solver(maze).distances \
+            if self.warm_start and missing else None
+        jobs = [(maze.name, maze.size, maze.array,
+                 tuple(maze.optimal_route), l_rate, discount,
+                 self.warm_start, distances)
+                for l_rate, discount in missing]
+        results = []
+        if self.executor is None:
+            for job in jobs:
+                config = f"{job[4]}-{job[5]}"
+                self.jobs.update_config(job_id, config, RUNNING)
+                try:
+                    results.append(train_configuration(*job))
+                except Exception:
+                    self.jobs.update_config(job_id, config, FAILED)
+                    raise
+                self.jobs.update_config(job_id, config, DONE)
+        else:
+            futures = []
+            try:
+                for job in jobs:
+                    config = f"{job[4]}-{job[5]}"
+                    self.jobs.update_config(job_id, config, SUBMITTED)
+                    future = self.executor.submit(train_configuration, *job)
+                    future.add_done_callback(
+                        lambda done, config=config: self.jobs.update_config(
+                            job_id, config, FAILED if done.cancelled() or
+                            done.exception() is not None else DONE)
+                    )
+                    futures.append(future)
+                results = [future.result() for future in futures]
+            except BrokenProcessPool:
+                # a worker died (e.g. out of memory), later mazes get a
+                # new pool
+                self._reset_executor(futures)
+                raise
+        trained = dict(zip(missing, results))
+        return [config + ((trained[config], None) if config in trained else
+                          (dict(stored[config].q_data), stored[config].img))
+                for config in configs]
+
+    def process_maze(self, maze: Maze, job_id: str = None):
+        """Process a maze: use A* and Q Learning techniques.
 
-    def process_maze(self, maze: Maze):
-        """Process a maze: use A* and Q Learning techniques."""
+        :param maze: maze to process
+        :param job_id: id of the job to report the progress to
+        """
         base_name = maze.name
+        self.jobs.start(job_id)
         try:
-            if base_name not in self.maze_list.names:
-                self.maze_list.names = base_name
-            else:
+            if not self.maze_list.reserve_name(base_name):
                 raise MazeNameExists("maze with this name already exists")
-            for l_rate in self.l_rates:
-                for discount in self.discounts:
-                    maze.find_q_data()
-                    maze.name = f"{base_name}-{l_rate}-{discount}"
-                    self.maze_list.mazes_list.append(maze.save_to_database())
-            self.maze_list.save()
+            for l_rate, discount, q_data, img in self._sweep(maze, job_id):
+                maze.learning_rate, maze.discount = l_rate, discount
+                maze.q_data = q_data
+                maze.name = f"{base_name}-{l_rate}-{discount}"
+                if img is None:
+                    maze.draw_solution()
+                else:
+                    maze.img = img
+                self.maze_list.add(maze.save_to_database())
+                if img is None:
+                    # later copies point to the first trained record
+                    self.results.add(maze.content_hash(
+                        warm_start=self.warm_start), maze.name)
         except MazeUnsolvableError:
+            self.maze_list.withdraw(base_name)
+            self.jobs.finish(job_id, "maze cannot be solved")
             print("Impossible to solve.")
         except MazeNameExists:
+            self.jobs.finish(job_id, "maze with this name already exists")
             print("Skipped maze because name exists.")
+        except Exception:
+            self.maze_list.withdraw(base_name)
+            raise
         else:
+            self.jobs.finish(job_id)
             print(f"Thread has finished processing {base_name} maze.")
@@ -1,51 +1,45 @@
-"""Work with the Q Learning processing."""
+"""Work with the Q Learning processing.
+
+PIL, OpenCV and matplotlib are imported only by the code drawing and
+plotting, so headless workers do not pay for loading them.
+"""
+from __future__ import annotations
 import numpy as np
-from PIL import Image
-import cv2
-import matplotlib.pyplot as plt
-from matplotlib import style
-from typing import Collection, Union
-
-
-class QAgent:
-    """Agent in the enviroment."""
-
-    def __init__(self, x: int, y: int):
-        """Create a new agent at position (x, y)."""
-        self.x = x
-        self.y = y
-
-    @property
-    def position(self) -> (int, int):
-        """Get the agent's position."""
-        return self.x, self.y
-
-    def __repr__(self) -> str:
-        return f"{self.x}, {self.y}"
-
-    def move(self, x: int = None, y: int = None):
-        """Move the agent by (x, y) or randomly if no value is given."""
-        # supports all directions
-        if x is None:
-            self.x += np.random.randint(-1, 2)
-        else:
-            self.x += x
+from typing import Collection, Optional, Union, TYPE_CHECKING
+from modules.maze_operations.maze_solver import DISTANCE_CACHE
+from modules.maze_operations.training_metrics import MetricsSink, \
+    RingBufferSink
 
-        if y is None:
-            self.y += np.random.randint(-1, 2)
-        else:
-            self.y += y
-
-    def action(self, choice: int):
-        """Move the agent according to choice."""
-        if choice == 0:
-            self.move(x=1, y=0)
-        elif choice == 1:
-            self.move(x=-1, y=0)
-        elif choice == 2:
-            self.move(x=0, y=1)
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class _Plateau:
+    """Detect that the outcome of the greedy policy stopped changing."""
+
+    def __init__(self, window: int):
+        """Create a detector.
+
+        :param window: number of episodes the outcome should stay the same
+        """
+        self.window = window
+        self.outcome = None
+        self.stable = 0
+
+    def update(self, outcome: tuple, episodes: int) -> bool:
+        """Register the outcome after some more episodes.
+
+        :param outcome: greedy (reward, path length) or None if unsolved
+        and the best episode reward so far
+        :param episodes: number of episodes since the previous update
+        :return: True if the outcome has plateaued
+        """
+        if outcome[0] is not None and outcome == self.outcome:
+            self.stable += episodes
         else:
-            self.move(x=0, y=-1)
+            self.stable = 0
+        self.outcome = outcome
+        return bool(self.window) and self.stable >= self.window
 
 
 class QLearner:
@@ -56,6 +50,10 @@ class QLearner:
     FINISH_REWARD = 25
     EPS_DECAY = 0.9998
     OPTIMIZATION_COEFF = 2000
+    CONVERGENCE_CHECK = 10  # optimization episodes between greedy rollouts
+    WARM_EPSILON = 0.1  # exploration left when starting from the prior
+    # row and column shifts for every action
+    MOVES = np.array(((1, 0), (-1, 0), (0, 1), (0, -1)))
     # BGR for some reason in cv2
     colors = {1: (255, 119, 0),
               2: (111, 216, 145),
@@ -63,6 +61,8 @@ class QLearner:
               4: (125, 142, 250),
               5: (252, 230, 119)}
     EMPTY_COLOR = 255  # white
+    IMAGE_SIZE = 600  # maximum side of a drawn image in pixels
+    RNG_BLOCK = 1024  # random numbers drawn at once in an episode
     AGENT_NUM = 1  # player key in dict
     FINISH_NUM = 2  # food key in dict
     START_NUM = 3  # start key in dict
@@ -71,7 +71,8 @@ class QLearner:
 
     def __init__(self, maze, epsilon: float = 1.0, episodes: int =
                  10000,
-                 show_episodes: int = 500):
+                 show_episodes: int = 500, convergence_window: int = 500,
+                 compact: bool = False, seed: int = None):
         """Create a new Q enviroment.
 
         :param maze: maze to base upon
@@ -79,65 +80,153 @@ class QLearner:
         :param epsilon: probability of choosing action randomly
         :param episodes: maximum episodes to repeat
         :param show_episodes: episodes to show (via %)
+        :param convergence_window: stop optimizing once the greedy route
+        has not changed for this many episodes (0 to always optimize for
+        OPTIMIZATION_COEFF episodes)
+        :param compact: whether to keep float32 Q values of open cells only
+        instead of float64 values of every cell
+        :param seed: seed of the random generator (a random one if None),
+        equal seeds give equal results
         """
-        style.use("ggplot")
         self.array = maze.array
         self.size = max(maze.size)
         self.iterations = self.size**2
         self.episodes = episodes
         self.show_eps = show_episodes
         self.epsilon = epsilon
+        self.convergence_window = convergence_window
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
         self.start = maze.start
         self.finish = maze.finish
-        self.env = np.array(self.array, dtype=np.int)
-        self.q_table = np.random.random_sample((self.size, self.size) + (4,))
+        self.env = maze.array
+        self.cols = self.env.shape[1]
+        # states are cells numbered row by row, open cells only if compact
+        if compact:
+            self.cells = np.flatnonzero(self.env.reshape(-1) != 1)
+        else:
+            self.cells = np.arange(self.env.size)
+        state_ids = np.full(self.env.size, -1, dtype=np.int32)
+        state_ids[self.cells] = np.arange(len(self.cells))
+        self.start_state = state_ids[self.start[0] * self.cols +
+                                     self.start[1]]
+        self.transitions, self.rewards = self._build_tables(state_ids)
+        self.q_table = self.rng.random((len(self.cells), 4))
+        if compact:
+            self.q_table = self.q_table.astype(np.float32)
+        self._background = None
+
+    def _build_tables(self, state_ids: np.ndarray) -> (np.ndarray,
+                                                       np.ndarray):
+        """Precompute the next state and reward for every state and action.
+
+        Moves into walls and over borders keep the agent in place.
+        :param state_ids: state of every cell (flat index)
+        :return: (states x 4) tables of next states and of rewards
+        """
+        rows, cols = self.env.shape
+        cells = self.env.reshape(-1)
+        sources = self.cells[:, None]
+        new_x = sources // cols + self.MOVES[:, 0]
+        new_y = sources % cols + self.MOVES[:, 1]
+        inside = (new_x >= 0) & (new_x < rows) & (new_y >= 0) & \
+                 (new_y < cols)
+        targets = new_x.clip(0, rows - 1) * cols + new_y.clip(0, cols - 1)
+        blocked = ~inside | (cells[targets] == 1)
+        targets = np.where(blocked, sources, targets)
+        rewards = np.where(blocked, -self.WALL_PENALTY,
+                           np.where(cells[targets] == 3,
+                                    self.FINISH_REWARD, -self.MOVE_PENALTY))
+        return state_ids[targets], rewards.astype(np.int32)
+
+    def _coords(self, state: int) -> (int, int):
+        """Get coordinates of the cell of a state."""
+        return divmod(int(self.cells[state]), self.cols)
+
+    def _to_coords(self, states: Collection) -> set:
+        """Convert a collection of states to a set of cell coordinates."""
+        return {self._coords(state) for state in states}
+
+    def distance_to_finish(self, distances: np.ndarray = None) -> np.ndarray:
+        """Get the number of moves to the finish from every state.
+
+        :param distances: distance field of the grid if it is already known
+        :return: distance of every state (-1 if the finish is unreachable)
+        """
+        if distances is None:
+            # the learner has the grid and the endpoints a solver needs
+            distances = DISTANCE_CACHE.solver(self).distances
+        return np.asarray(distances).reshape(-1)[self.cells]
 
-    def get_reward(self, player: QAgent, obs: tuple) -> int:
-        """Get the reward for moving.
+    def apply_prior(self, discount: float, distances: np.ndarray = None):
+        """Set Q values to the returns of shortest routes to the finish.
 
-        :param player: current agent
-        :param obs: current observation (agent position)
-        :return: the reward depending on action
+        Values of the states the finish is reachable from are computed in
+        closed form from their distance to it; training then only has to
+        correct them, so exploration is reduced to WARM_EPSILON.
+        :param discount: discount rate
+        :param distances: distance field of the grid (see
+        ``MazeSolver.distances``), searched for if None
         """
-        if (player.x >= self.size or
-                player.y >= self.size or
-                player.x < 0 or
-                player.y < 0 or
-                self.env[player.position] == 1):
-            player.x, player.y = obs
-            return -self.WALL_PENALTY
-        elif self.env[player.position] == 3:
-            return self.FINISH_REWARD
+        distances = self.distance_to_finish(distances)
+        # return of a state d moves away: d - 1 penalties and the reward
+        steps = np.maximum(distances - 1, 0)
+        if discount == 1:
+            penalties = steps
         else:
-            return -self.MOVE_PENALTY
+            penalties = (1 - discount ** steps) / (1 - discount)
+        values = (self.FINISH_REWARD * discount ** steps -
+                  self.MOVE_PENALTY * penalties)
+        q_values = np.where(self.rewards == self.FINISH_REWARD,
+                            self.FINISH_REWARD,
+                            self.rewards + discount * values[self.transitions])
+        reachable = distances > 0
+        self.q_table[reachable] = q_values[reachable]
+        self.epsilon = min(self.epsilon, self.WARM_EPSILON)
+
+    def _color_table(self) -> np.ndarray:
+        """Get the colour of every maze array value (empty, wall, ends)."""
+        table = np.full((4, 3), self.EMPTY_COLOR, dtype=np.uint8)
+        table[1] = self.colors[self.WALL_NUM]
+        table[2] = self.colors[self.START_NUM]
+        table[3] = self.colors[self.FINISH_NUM]
+        return table
+
+    def _static_frame(self) -> np.ndarray:
+        """Get the frame with walls and endpoints (built once per maze)."""
+        if self._background is None:
+            self._background = self._color_table()[self.env]
+        return self._background
 
     def draw_maze(self, route: Collection, reward: int = None,
                   new_obs: tuple = None, verbose: bool = False) -> Image:
         """Draw the maze and return the image.
 
+        The image is upscaled by the largest integer factor that fits
+        into IMAGE_SIZE pixels.
         :param route: route to include
         :param reward: reward to indicate completion
         :param new_obs: new observation (next state)
         :param verbose: whether to display the image
         :return: the image object
         """
-        env = np.ndarray((self.size, self.size, 3),
-                         dtype=np.uint8)
-        env.fill(self.EMPTY_COLOR)
-        for place in route:
-            env[place] = self.colors[self.ROUTE_NUM]
-        env[self.start] = self.colors[self.START_NUM]
-        env[self.finish] = self.colors[self.FINISH_NUM]
-        if new_obs:
+        env = self._static_frame().copy()
+        if route:
+            rows, cols = np.array(list(route)).T
+            empty = self.env[rows, cols] == 0
+            env[rows[empty], cols[empty]] = self.colors[self.ROUTE_NUM]
+        if new_obs and self.env[new_obs] != 1:
             env[new_obs] = self.colors[self.AGENT_NUM]
-        for ii in range(self.size):
-            for jj in range(self.size):
-                if self.env[ii][jj] == 1:
-                    env[ii][jj] = self.colors[self.WALL_NUM]
+        scale = max(1, self.IMAGE_SIZE // max(env.shape[:2]))
+        if scale > 1:
+            env = np.repeat(np.repeat(env, scale, axis=0), scale, axis=1)
+        from PIL import Image
         img = Image.fromarray(env, 'RGB')
-        img = img.resize((600, 600), Image.NEAREST)
         if verbose:
-            cv2.imshow("image", np.array(img))
+            import cv2
+            cv2.imshow("image", env)
             if reward and reward == self.FINISH_REWARD:
                 if cv2.waitKey(500):
                     return img
@@ -146,33 +235,45 @@ class QLearner:
                     return img
         return img
 
-    def choose_action(self, obs: tuple) -> Union[int, np.ndarray]:
-        """Choose the action for q agent (randomly or optimally).
+    def greedy_rollout(self) -> Optional[tuple]:
+        """Follow the greedy policy from the start without learning.
 
-        :param obs: current state
-        :return: the action (int 0-3)
+        :return: (reward, number of steps) if the finish is reached,
+        None if the policy loops
         """
-        if np.random.random() > self.epsilon:
-            # GET THE ACTION
-            return np.argmax(self.q_table[obs])
-        else:
-            return np.random.randint(0, 4)
-
-    def train_single_episode(self, episode: int, episode_rewards: list,
+        state = self.start_state
+        visited = {state}
+        total_reward = 0
+        for step in range(1, self.iterations + 1):
+            choice = np.argmax(self.q_table[state])
+            total_reward += self.rewards[state, choice]
+            if self.rewards[state, choice] == self.FINISH_REWARD:
+                return int(total_reward), step
+            state = self.transitions[state, choice]
+            if state in visited:
+                # a deterministic policy never leaves a loop
+                return None
+            visited.add(state)
+        return None
+
+    def train_single_episode(self, episode: int,
+                             episode_rewards: MetricsSink,
                              learning_rate: float, discount: float,
                              verbose: bool,
                              track: bool = False) -> Union[Collection, bool]:
         """Train a single episode.
 
         :param episode: number of episode (from 0)
-        :param episode_rewards: list of all episode rewards
+        :param episode_rewards: sink receiving episode rewards
         :param learning_rate: learning rate
         :param discount: discount rate
         :param verbose: whether to display additional information
         :param track: whether to track all episodes' routes and rewards
         :return: if track return route, if solved return False, else True
         """
-        player = QAgent(*self.start)
+        transitions, rewards = self.transitions, self.rewards
+        block = min(self.iterations, self.RNG_BLOCK)
+        obs = self.start_state
         unsolved = True
         show = False
         if track or verbose:
@@ -180,24 +281,30 @@ class QLearner:
         if verbose and episode % self.show_eps == 0:
             print(f"Episode #{episode}: epsilon = {self.epsilon}")
             print(f"{self.show_eps} episodes mean: "
-                  f"{np.mean(episode_rewards[-self.show_eps:])}")
+                  f"{np.mean(episode_rewards.recent(self.show_eps))}")
             show = True
 
         episode_reward = 0
         for i in range(self.iterations):
-            obs = player.position
-            choice = self.choose_action(obs)
+            if i % block == 0:
+                # draw random numbers for the next steps at once
+                uniforms = self.rng.random(block).tolist()
+                actions = self.rng.integers(0, 4, block).tolist()
+            # choose the action (randomly or optimally)
+            if uniforms[i % block] > self.epsilon:
+                choice = np.argmax(self.q_table[obs])
+            else:
+                choice = actions[i % block]
             # take the action
-            player.action(choice)
-            reward = self.get_reward(player, obs)
-            new_obs = player.position
+            new_obs = transitions[obs, choice]
+            reward = rewards[obs, choice]
 
             if track or verbose:
                 route.add(new_obs)
 
             # get q values
             max_future_q = np.max(self.q_table[new_obs])
-            current_q = self.q_table[obs][choice]
+            current_q = self.q_table[obs, choice]
 
             # change q values according to the reward
             if reward == self.FINISH_REWARD:
@@ -205,33 +312,35 @@ class QLearner:
             else:
                 new_q = ((1 - learning_rate) * current_q +
                          learning_rate * (reward + discount * max_future_q))
-            self.q_table[obs][choice] = new_q
+            self.q_table[obs, choice] = new_q
 
             if show:
-                self.draw_maze(route, reward, new_obs, verbose)
+                self.draw_maze(self._to_coords(route), reward,
+                               self._coords(new_obs), verbose)
 
             episode_reward += reward
+            obs = new_obs
             if reward == self.FINISH_REWARD:
                 # end cycle if the goal is reached
                 unsolved = False
                 break
         self.epsilon *= self.EPS_DECAY
-        episode_rewards.append(episode_reward)
+        episode_rewards.append(int(episode_reward))
         if track:
-            return route
+            return self._to_coords(route)
         return unsolved
 
-    def train_env(self, learning_rate: float = 0.1, discount: float = 0.95,
-                  verbose: bool = False) -> dict:
-        """Train the whole enviroment while not solved.
+    def _train_sequential(self, learning_rate: float, discount: float,
+                          episode_rewards: MetricsSink,
+                          verbose: bool) -> dict:
+        """Train the whole enviroment one episode at a time.
 
-        When solved optimizes route for some iterations.
         :param learning_rate: learning rate
         :param discount: discount rate
+        :param episode_rewards: sink receiving episode rewards
         :param verbose: whether to display additional info
         :return: valuable analysis information
         """
-        episode_rewards = []
         episode = 0
         unsolved = True
         q_feed = {}
@@ -243,28 +352,178 @@ class QLearner:
         if verbose:
             print(f"\nSolved at #{episode}: epsilon = {self.epsilon}")
             print(f"{self.show_eps} episodes mean: "
-                  f"{np.mean(episode_rewards[-self.show_eps:])}\n")
+                  f"{np.mean(episode_rewards.recent(self.show_eps))}\n")
 
         q_feed["solution episode"] = episode
-        track = {}
-        # allow agent to optimize found route
-        for episode in range(episode, self.OPTIMIZATION_COEFF+episode):
-            route = self.train_single_episode(episode, episode_rewards,
-                                              learning_rate, discount, verbose,
-                                              track=True)
-            track[episode] = (episode_rewards[-1], route)
-
-        optimal_values = track[max(track, key=lambda x: track[x][0])]
-        q_feed["max_reward"], q_feed["solution_path"] = optimal_values
-
-        moving_avg = np.convolve(episode_rewards,
+        plateau = _Plateau(self.convergence_window)
+        q_feed["max_reward"] = None
+        # allow agent to optimize found route keeping the best one
+        for optimized in range(1, self.OPTIMIZATION_COEFF + 1):
+            route = self.train_single_episode(episode + optimized - 1,
+                                              episode_rewards, learning_rate,
+                                              discount, verbose, track=True)
+            reward = episode_rewards.last
+            if q_feed["max_reward"] is None or reward > q_feed["max_reward"]:
+                q_feed["max_reward"], q_feed["solution_path"] = reward, route
+            if (optimized % self.CONVERGENCE_CHECK == 0 and
+                    plateau.update((self.greedy_rollout(),
+                                    q_feed["max_reward"]),
+                                   self.CONVERGENCE_CHECK)):
+                break
+        q_feed["episodes saved"] = self.OPTIMIZATION_COEFF - optimized
+        return q_feed
+
+    def train_batch(self, agents: int, episode_rewards: MetricsSink,
+                    learning_rate: float, discount: float,
+                    track: bool = False) -> Union[tuple, np.ndarray]:
+        """Train several episodes at once, one agent per episode.
+
+        All agents start together and advance in lockstep sharing the
+        Q-table; an agent stops as soon as it reaches the finish.
+        :param agents: number of episodes (agents) in the batch
+        :param episode_rewards: sink receiving episode rewards
+        :param learning_rate: learning rate
+        :param discount: discount rate
+        :param track: whether to track the best episode's route and reward
+        :return: if track (reward, route) of the best episode,
+        else the mask of solved episodes
+        """
+        states = np.full(agents, self.start_state)
+        epsilon = self.epsilon * self.EPS_DECAY ** np.arange(agents)
+        active = np.ones(agents, dtype=bool)
+        episode_reward = np.zeros(agents, dtype=int)
+        trajectory = []
+
+        for _ in range(self.iterations):
+            # batched epsilon-greedy choice
+            greedy = np.argmax(self.q_table[states], axis=1)
+            explore = self.rng.random(agents) <= epsilon
+            choice = np.where(explore, self.rng.integers(0, 4, agents),
+                              greedy)
+            # batched move and reward lookup
+            new_states = self.transitions[states, choice]
+            reward = self.rewards[states, choice]
+            finished = reward == self.FINISH_REWARD
+
+            # scatter update of q values
+            max_future_q = np.max(self.q_table[new_states], axis=1)
+            current_q = self.q_table[states, choice]
+            new_q = np.where(finished, self.FINISH_REWARD,
+                             (1 - learning_rate) * current_q +
+                             learning_rate * (reward +
+                                              discount * max_future_q))
+            self.q_table[states[active], choice[active]] = new_q[active]
+
+            episode_reward[active] += reward[active]
+            states = np.where(active, new_states, states)
+            if track:
+                trajectory.append((states.copy(), active.copy()))
+            active &= ~finished
+            if not active.any():
+                break
+        self.epsilon *= self.EPS_DECAY ** agents
+        episode_rewards.extend(episode_reward)
+        if track:
+            best = int(np.argmax(episode_reward))
+            route = self._to_coords(step_states[best]
+                                    for step_states, step_active in trajectory
+                                    if step_active[best])
+            return int(episode_reward[best]), route
+        return ~active
+
+    def _train_batched(self, learning_rate: float, discount: float,
+                       batch_size: int, episode_rewards: MetricsSink,
+                       verbose: bool) -> dict:
+        """Train the whole enviroment running episodes in batches.
+
+        :param learning_rate: learning rate
+        :param discount: discount rate
+        :param batch_size: number of episodes advanced in lockstep
+        :param episode_rewards: sink receiving episode rewards
+        :param verbose: whether to display additional info
+        :return: valuable analysis information
+        """
+        episode = 0
+        solved = None
+        q_feed = {}
+        while episode < self.episodes:
+            agents = min(batch_size, self.episodes - episode)
+            solved = self.train_batch(agents, episode_rewards,
+                                      learning_rate, discount)
+            if verbose:
+                print(f"Episodes #{episode + 1}-{episode + agents}: "
+                      f"epsilon = {self.epsilon}, solved {solved.sum()}")
+            if solved.any():
+                episode += int(np.argmax(solved)) + 1
+                break
+            episode += agents
+
+        q_feed["solution episode"] = episode
+        plateau = _Plateau(self.convergence_window)
+        q_feed["max_reward"] = None
+        optimized = 0
+        # allow agents to optimize found route keeping the best one
+        while optimized < self.OPTIMIZATION_COEFF:
+            agents = min(batch_size, self.OPTIMIZATION_COEFF - optimized)
+            reward, route = self.train_batch(agents, episode_rewards,
+                                             learning_rate, discount,
+                                             track=True)
+            optimized += agents
+            if q_feed["max_reward"] is None or reward > q_feed["max_reward"]:
+                q_feed["max_reward"], q_feed["solution_path"] = reward, route
+            if plateau.update((self.greedy_rollout(), q_feed["max_reward"]),
+                              agents):
+                break
+        q_feed["episodes saved"] = self.OPTIMIZATION_COEFF - optimized
+        return q_feed
+
+    def plot_rewards(self, rewards: np.ndarray):
+        """Plot the moving average of episode rewards and show it."""
+        import matplotlib.pyplot as plt
+        from matplotlib import style
+        style.use("ggplot")
+        moving_avg = np.convolve(rewards,
                                  np.ones((self.show_eps,)) / self.show_eps,
                                  mode='valid')
-
+        figure = plt.figure()
         plt.plot([i for i in range(len(moving_avg))], moving_avg)
         plt.ylabel(f"Reward {self.show_eps}ma")
         plt.xlabel("episode #")
-        if verbose:
-            plt.show()
+        plt.show()
+        plt.close(figure)
+
+    def train_env(self, learning_rate: float = 0.1, discount: float = 0.95,
+                  verbose: bool = False, batch_size: int = None,
+                  metrics: MetricsSink = None, warm_start: bool = False,
+                  distances: np.ndarray = None) -> dict:
+        """Train the whole enviroment while not solved.
+
+        When solved optimizes route for some iterations.
+        :param learning_rate: learning rate
+        :param discount: discount rate
+        :param verbose: whether to display additional info
+        :param batch_size: if given, train this many episodes in lockstep
+        :param metrics: sink for episode rewards (if None, rewards are kept
+        and plotted only when verbose); the caller closes it
+        :param warm_start: whether to start from the shortest routes prior
+        :param distances: distance field of the grid for the prior
+        :return: valuable analysis information
+        """
+        if metrics is None:
+            metrics = RingBufferSink(
+                self.episodes + self.OPTIMIZATION_COEFF, plot=True
+            ) if verbose else MetricsSink()
+        if warm_start:
+            self.apply_prior(discount, distances)
+        if batch_size:
+            q_feed = self._train_batched(learning_rate, discount, batch_size,
+                                         metrics, verbose)
+        else:
+            q_feed = self._train_sequential(learning_rate, discount,
+                                            metrics, verbose)
+        q_feed["seed"] = self.seed
+        q_feed["warm_start"] = warm_start
+        if metrics.plot:
+            self.plot_rewards(metrics.series())
 
         return q_feed
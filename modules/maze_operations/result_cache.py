@@ -0,0 +1,84 @@
+"""Reuse training results of mazes that were already processed."""
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+from modules.maze_operations.maze_adt import Maze
+
+
+class ResultCache:
+    """Map content hashes of trained mazes to their database records.
+
+    A content hash covers the grid, the endpoints and the training settings
+    (see ``Maze.content_hash``), so the same maze submitted under another
+    name finds the stored results. The map is kept as a journal of JSON
+    lines next to the mazes.
+    """
+
+    def __init__(self, database: str = "static/database",
+                 filename: str = "results.jsonl"):
+        """Load the cache from the database.
+
+        :param database: path to the database directory
+        :param filename: name of the journal in the database directory
+        """
+        self.lock = Lock()
+        self.database = Path(database)
+        self.filename = self.database / filename
+        self._records = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.filename, encoding="utf-8") as cache_f:
+                lines = cache_f.readlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be cut short by a crash
+                continue
+            self._records[entry["hash"]] = entry["name"]
+
+    def get(self, key: str) -> Optional[Maze]:
+        """Get the stored maze with the content hash.
+
+        :param key: content hash
+        :return: the stored maze, None if it was never trained or is gone
+        """
+        with self.lock:
+            name = self._records.get(key)
+        path = self.database / name if name is not None else None
+        if path is None or not ((path / "header.json").exists() or
+                                (path / "data.json").exists()):
+            with self.lock:
+                self.misses += 1
+            return None
+        maze = Maze.read_from_database(path)
+        with self.lock:
+            self.hits += 1
+        return maze
+
+    def add(self, key: str, name: str):
+        """Remember where the results for the content hash are stored.
+
+        :param key: content hash
+        :param name: name of the stored maze
+        """
+        line = json.dumps({"hash": key, "name": name}) + "\n"
+        with self.lock:
+            if self._records.get(key) == name:
+                return
+            self._records[key] = name
+            with open(self.filename, mode="a", encoding="utf-8") as cache_f:
+                cache_f.write(line)
+                cache_f.flush()
+                os.fsync(cache_f.fileno())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
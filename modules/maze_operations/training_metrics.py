@@ -0,0 +1,140 @@
+"""Sinks receiving episode rewards of Q Learning training."""
+from pathlib import Path
+from typing import Iterable
+import numpy as np
+
+
+class MetricsSink:
+    """Discard episode rewards keeping only the last one.
+
+    Training reports every episode reward to a sink; rewards are plotted
+    after training only if the sink asks for it with ``plot``.
+    """
+    plot = False
+
+    def __init__(self):
+        """Create an empty sink."""
+        self.last = None
+        self.episodes = 0
+
+    def append(self, reward: float):
+        """Record the reward of an episode."""
+        self.last = reward
+        self.episodes += 1
+
+    def extend(self, rewards: Iterable):
+        """Record rewards of several episodes."""
+        for reward in rewards:
+            self.append(reward)
+
+    def recent(self, number: int) -> np.ndarray:
+        """Get up to number last rewards that are kept."""
+        if self.last is None or number <= 0:
+            return np.array([])
+        return np.array([self.last])
+
+    def series(self) -> np.ndarray:
+        """Get all kept rewards in order."""
+        return self.recent(1)
+
+    def close(self):
+        """Release resources of the sink."""
+        pass
+
+
+class RingBufferSink(MetricsSink):
+    """Keep last rewards in a fixed-size in-memory buffer."""
+
+    def __init__(self, capacity: int = 12000, plot: bool = False):
+        """Create an empty buffer.
+
+        :param capacity: number of last rewards to keep
+        :param plot: whether to plot the rewards after training
+        """
+        super().__init__()
+        self.capacity = capacity
+        self.plot = plot
+        self._buffer = np.zeros(capacity)
+
+    def append(self, reward: float):
+        """Record the reward of an episode."""
+        self._buffer[self.episodes % self.capacity] = reward
+        super().append(reward)
+
+    def extend(self, rewards: Iterable):
+        """Record rewards of several episodes."""
+        rewards = np.asarray(list(rewards), dtype=float)
+        if not len(rewards):
+            return
+        positions = self.episodes + np.arange(len(rewards))
+        # only the last capacity rewards survive
+        self._buffer[positions[-self.capacity:] % self.capacity] = \
+            rewards[-self.capacity:]
+        self.last = rewards[-1].item()
+        self.episodes += len(rewards)
+
+    def recent(self, number: int) -> np.ndarray:
+        """Get up to number last rewards that are kept."""
+        number = max(0, min(number, self.episodes, self.capacity))
+        positions = self.episodes - number + np.arange(number)
+        return self._buffer[positions % self.capacity]
+
+    def series(self) -> np.ndarray:
+        """Get all kept rewards in order."""
+        return self.recent(self.capacity)
+
+
+class FileSink(RingBufferSink):
+    """Write all rewards to a CSV or NPY file.
+
+    CSV rows are written as episodes finish, an NPY series is saved when
+    the sink is closed. Last rewards are also kept in memory.
+    """
+
+    def __init__(self, path: str, capacity: int = 1000, plot: bool = False):
+        """Create a sink writing to the file.
+
+        :param path: path to a .csv or .npy file
+        :param capacity: number of last rewards to keep in memory
+        :param plot: whether to plot the kept rewards after training
+        """
+        super().__init__(capacity, plot)
+        self.path = Path(path)
+        if self.path.suffix == ".csv":
+            self._file = open(self.path, mode="w+", encoding="utf-8")
+            self._file.write("episode,reward\n")
+            self._chunks = None
+        elif self.path.suffix == ".npy":
+            self._file = None
+            self._chunks = []
+        else:
+            raise ValueError("metrics file should be .csv or .npy")
+
+    def _write(self, rewards: np.ndarray):
+        """Write rewards of the episodes following the recorded ones."""
+        if self._file is not None:
+            self._file.writelines(
+                f"{episode},{reward:g}\n" for episode, reward in
+                enumerate(rewards.tolist(), start=self.episodes + 1)
+            )
+        else:
+            self._chunks.append(rewards)
+
+    def append(self, reward: float):
+        """Record the reward of an episode."""
+        self._write(np.array([reward], dtype=float))
+        super().append(reward)
+
+    def extend(self, rewards: Iterable):
+        """Record rewards of several episodes."""
+        rewards = np.asarray(list(rewards), dtype=float)
+        self._write(rewards)
+        super().extend(rewards)
+
+    def close(self):
+        """Flush the rewards to the file."""
+        if self._file is not None:
+            self._file.close()
+        elif self._chunks is not None:
+            np.save(self.path, np.concatenate(self._chunks or [np.array([])]))
+            self._chunks = None
@@ -1,18 +1,29 @@
 """Work with the web app."""
+import argparse
+import hashlib
+import json
+from datetime import datetime, timezone
 from flask import request, jsonify, make_response, Flask, render_template,\
-    session
+    session, Response
 from flask_session import Session
 from modules.maze_operations.maze_adt import Maze, MazeUnsolvableError, \
     MazeNameError, MazeConstructionError
 from modules.maze_operations.process_maze import BackgroundProcessor
-from modules.helper_collections.llistqueue import Queue
+from modules.helper_collections.blocking_queue import BlockingQueue, \
+    QueueFull
 from modules.maze_operations.maze_list import MazesList
+from modules.maze_operations.maze_api_client import MazeAPIError
+from modules.maze_operations.job_table import JobTable, DONE, FAILED
 
 
 app = Flask(__name__)
 app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_TYPE"] = "filesystem"
 Session(app)
+jobs = JobTable()
+EVENTS_HEARTBEAT = 15  # seconds between keep-alive comments of job events
+STATS_LIMIT = 20  # mazes on a stats page by default
+STATS_MAX_LIMIT = 100
 
 
 @app.route("/", methods=["GET"])
@@ -22,22 +33,141 @@ def render_main_page():
     return render_template("index.html", **maze_list.get_context())
 
 
+def stats_query() -> dict:
+    """Get the stats query of the request or the one stored in session.
+
+    Only the query is kept in the session, results are read from the
+    maze list on every request.
+    """
+    if request.args:
+        session["stats_query"] = request.args.to_dict()
+    query = dict(session.get("stats_query") or {})
+    if query.get("sort_option") not in maze_list.keys_to_reversed:
+        query["sort_option"] = "max_reward"
+    return query
+
+
+def stats_page(query: dict) -> dict:
+    """Get the requested slice of sorted and filtered mazes.
+
+    :param query: sort option, filters, page and limit
+    :return: mazes of the page and the pagination details
+    """
+    filters = dict(query)
+    try:
+        page = max(1, int(filters.pop("page", 1)))
+        limit = int(filters.pop("limit", STATS_LIMIT))
+    except ValueError:
+        page, limit = 1, STATS_LIMIT
+    limit = min(max(1, limit), STATS_MAX_LIMIT)
+    mazes, total = maze_list.sort_page(filters, page, limit)
+    return {"mazes": mazes, "page": page, "limit": limit, "total": total,
+            "pages": max(1, -(-total // limit))}
+
+
+def conditional_response(query: dict):
+    """Get a 304 response if the client has the current page, else None.
+
+    The validators change whenever the maze list changes.
+    """
+    digest = hashlib.blake2b(json.dumps(query, sort_keys=True).encode(),
+                             digest_size=8).hexdigest()
+    response = make_response()
+    response.set_etag(f"{maze_list.version}-{maze_list.modified}-{digest}")
+    response.last_modified = datetime.fromtimestamp(maze_list.modified,
+                                                    timezone.utc)
+    response.make_conditional(request)
+    return response
+
+
+def with_validators(response, validators):
+    """Copy the cache validators to the response."""
+    response.headers["ETag"] = validators.headers["ETag"]
+    response.last_modified = validators.last_modified
+    return response
+
+
 @app.route("/stats.html", methods=["GET"])
 def render_stats_page():
-    """Render statistics page on initial and form request."""
+    """Render a page of statistics on initial and form request."""
     global maze_list
-    if session.get("mazes") is None:
-        session["mazes"] = maze_list.sort_by_key({"sort_option": "max_reward"})
-    if request.args:
-        session["mazes"] = maze_list.sort_by_key(dict(request.args))
-    return render_template("stats.html", **maze_list.get_context(),
-                           mazes=session["mazes"])
+    query = stats_query()
+    validators = conditional_response(query)
+    if validators.status_code == 304:
+        return validators
+    page = stats_page(query)
+    # links to other pages keep the sort option and filters
+    link_args = {key: value for key, value in query.items() if key != "page"}
+    return with_validators(make_response(render_template(
+        "stats.html", **maze_list.get_context(), **page, link_args=link_args
+    )), validators)
+
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    """Get a page of statistics as JSON."""
+    global maze_list
+    query = stats_query()
+    validators = conditional_response(query)
+    if validators.status_code == 304:
+        return validators
+    page = stats_page(query)
+    page["version"] = maze_list.version
+    return with_validators(make_response(jsonify(page), 200), validators)
+
+
+def enqueue_maze(maze: Maze):
+    """Push the maze to the processing queue and make the response.
+
+    The response carries the id of the job tracking the maze.
+    """
+    global queue
+    job = jobs.create(maze.name)
+    try:
+        queue.push((maze, job.id))
+    except QueueFull:
+        jobs.discard(job.id)
+        return make_response(jsonify({"message": "Too many mazes are "
+                                                 "waiting, try again later"}),
+                             429)
+    return make_response(jsonify({"message": "OK", "job": job.id}), 200)
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """Get the state of a job."""
+    state = jobs.get(job_id)
+    if state is None:
+        return make_response(jsonify({"message": "No such job"}), 404)
+    return make_response(jsonify(state), 200)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job(job_id: str):
+    """Stream the states of a job as server-sent events until it ends."""
+    state = jobs.get(job_id)
+    if state is None:
+        return make_response(jsonify({"message": "No such job"}), 404)
+
+    def events():
+        current = state
+        while current is not None:
+            yield f"data: {json.dumps(current)}\n\n"
+            if current["state"] in (DONE, FAILED):
+                return
+            version = current["version"]
+            current = jobs.wait(job_id, version, EVENTS_HEARTBEAT)
+            while current is not None and current["version"] == version:
+                yield ": keep-alive\n\n"
+                current = jobs.wait(job_id, version, EVENTS_HEARTBEAT)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
 
 
 @app.route("/api/", methods=["POST"])
 def handle_api_request():
     """Handle api post requests."""
-    global queue
     req = request.get_json()
     print(req)
     try:
@@ -51,16 +181,17 @@ def handle_api_request():
                                                 "A-Z, a-z and _"}), 422)
     except MazeUnsolvableError:
         res = make_response(jsonify({"message": "Should be solvable"}), 422)
+    except MazeAPIError:
+        res = make_response(jsonify({"message": "Maze API is unavailable, "
+                                                "try again later"}), 502)
     else:
-        res = make_response(jsonify({"message": "OK"}), 200)
-        queue.push(maze)
+        res = enqueue_maze(maze)
     return res
 
 
 @app.route("/editor/", methods=["POST"])
 def handle_editor_request():
     """Handle editor post requests."""
-    global queue
     req = request.get_json()
     print(req)
     try:
@@ -71,13 +202,29 @@ def handle_editor_request():
     except MazeUnsolvableError:
         res = make_response(jsonify({"message": "Should be solvable"}), 422)
     else:
-        res = make_response(jsonify({"message": "OK"}), 200)
-        queue.push(maze)
+        res = enqueue_maze(maze)
     return res
 
 
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments of the app."""
+    parser = argparse.ArgumentParser(description="Host the maze classifier.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for training (default: all "
+                             "CPUs, 0 to train in the background thread)")
+    parser.add_argument("--queue-size", type=int, default=100,
+                        help="maximum number of mazes waiting for training "
+                             "(0 for unbounded)")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="start training from the shortest routes "
+                             "instead of a random Q-table")
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
+    args = parse_args()
     maze_list = MazesList()
-    queue = Queue()
-    BackgroundProcessor(queue, maze_list).start()
+    queue = BlockingQueue(args.queue_size)
+    BackgroundProcessor(queue, maze_list, workers=args.workers,
+                        warm_start=args.warm_start, jobs=jobs).start()
     app.run()
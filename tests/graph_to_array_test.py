@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Test the conversion of API graphs to maze grids."""
+import json
+import unittest
+from pathlib import Path
+import numpy as np
+from modules.maze_operations.maze_adt import Maze
+
+# graphs with grids produced by the former list-based conversion
+FIXTURES = Path(__file__).parent / "api_mazes.json"
+
+
+class GraphToArrayTest(unittest.TestCase):
+    """Compare the vectorized conversion with the saved grids."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(FIXTURES, encoding="utf-8") as f:
+            cls.fixtures = json.load(f)
+
+    def test_saved_grids(self):
+        for fixture in self.fixtures:
+            graph = fixture["graph"]
+            dimensions = (graph["dimensions"]["width"],
+                          graph["dimensions"]["height"])
+            array, size = Maze._graph_to_array(graph["cellMap"], dimensions,
+                                               graph["start"], graph["end"])
+            self.assertEqual(array.dtype, np.uint8)
+            self.assertEqual(size, tuple(fixture["size"]))
+            np.testing.assert_array_equal(array, fixture["array"])
+
+    def test_from_graph(self):
+        for fixture in self.fixtures:
+            maze = Maze.from_graph("fixture", fixture["graph"])
+            np.testing.assert_array_equal(maze.array, fixture["array"])
+            self.assertEqual(maze.size_str,
+                             "x".join(str(side + 1) for side in maze.size))
+            maze.find_optimal_route()
+
+    def test_grid_round_trip(self):
+        for fixture in self.fixtures:
+            maze = Maze.from_graph("fixture", fixture["graph"])
+            restored = Maze("restored", size=maze.size, array=maze.to_list())
+            np.testing.assert_array_equal(restored.array, maze.array)
+            self.assertEqual((restored.start, restored.finish),
+                             (maze.start, maze.finish))
+
+
+if __name__ == '__main__':
+    unittest.main()
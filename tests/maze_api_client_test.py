@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Test the Maze API client against a local stub server."""
+import json
+import random
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+from modules.maze_operations import maze_api_client
+from modules.maze_operations.maze_adt import Maze, MazeConstructionError
+from modules.maze_operations.maze_api_client import MazeAPIClient, \
+    MazeAPIError, iter_json_array
+
+# node shift of every exit as the API reports it
+EXITS = {"n": (0, 1), "s": (0, -1), "w": (-1, 0), "e": (1, 0)}
+
+
+def generate_graph(width: int, height: int, seed: int = 0) -> dict:
+    """Generate an API graph of a perfect maze with a backtracker."""
+    rng = random.Random(seed)
+    exits = {(x, y): {} for x in range(1, width + 1)
+             for y in range(1, height + 1)}
+    stack = [(1, 1)]
+    visited = {(1, 1)}
+    while stack:
+        x, y = stack[-1]
+        options = [(name, (x + dx, y + dy)) for name, (dx, dy) in
+                   EXITS.items() if (x + dx, y + dy) in exits and
+                   (x + dx, y + dy) not in visited]
+        if not options:
+            stack.pop()
+            continue
+        name, near = rng.choice(options)
+        exits[(x, y)][name] = {"x": near[0], "y": near[1]}
+        visited.add(near)
+        stack.append(near)
+    return {"dimensions": {"width": width, "height": height},
+            "cellMap": [{"coordinates": {"x": x, "y": y}, "exits": node}
+                        for (x, y), node in exits.items()],
+            "start": {"x": 1, "y": 1},
+            "end": {"x": width, "y": height}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serve generated mazes like the Maze API does."""
+    protocol_version = "HTTP/1.1"
+    failures = 0  # number of next requests answered with 503
+    delay = None  # event to wait for before answering
+    requests = []
+
+    def log_message(self, *args):
+        """Keep the test output clean."""
+        pass
+
+    def _send(self, status: int, body: bytes, chunk: int = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        chunk = chunk or len(body) or 1
+        for pos in range(0, len(body), chunk):
+            self.wfile.write(body[pos:pos + chunk])
+            self.wfile.flush()
+
+    def do_GET(self):
+        """Answer a request for one maze or for several new ones."""
+        cls = type(self)
+        cls.requests.append((self.path, self.client_address))
+        if cls.delay is not None:
+            cls.delay.wait(2)
+        if cls.failures:
+            cls.failures -= 1
+            self._send(503, b"{}")
+            return
+        url = urlsplit(self.path)
+        maze_id = url.path[len("/api/mazes/"):]
+        if maze_id:
+            self._send(200, json.dumps(generate_graph(6, 5)).encode())
+            return
+        query = parse_qs(url.query)
+        number = int(query["number"][0])
+        if query.get("solutionLength") == ["1"]:
+            number = 0
+        graphs = [generate_graph(int(query["width"][0]),
+                                 int(query["height"][0]), seed)
+                  for seed in range(number)]
+        # stream the array in small pieces
+        self._send(200, json.dumps(graphs, indent=1).encode(), chunk=97)
+
+
+class MazeAPIClientTest(unittest.TestCase):
+    """Test fetching, streaming, retries and timeouts."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/api/mazes/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.failures = 0
+        StubHandler.delay = None
+        StubHandler.requests = []
+        self.client = MazeAPIClient(self.url, timeout=(1, 1), backoff=0)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_iter_json_array(self):
+        items = [{"a": [1, 2, "]"]}, {"b": "{,}"}, 3]
+        text = json.dumps(items)
+        for size in (1, 2, 5, len(text)):
+            chunks = [text[pos:pos + size]
+                      for pos in range(0, len(text), size)]
+            self.assertEqual(list(iter_json_array(chunks)), items)
+        with self.assertRaises(MazeAPIError):
+            list(iter_json_array(['[{"a": 1}, {"b"']))
+        with self.assertRaises(MazeAPIError):
+            list(iter_json_array(['{"a": 1}']))
+
+    def test_iter_json_array_large(self):
+        graphs = [generate_graph(100, 100, seed) for seed in range(2)]
+        text = json.dumps(graphs)
+        chunks = [text[pos:pos + 512] for pos in range(0, len(text), 512)]
+        decoded = []
+        scanned = [0]
+        tokens = maze_api_client._TOKENS
+
+        class CountingTokens:
+            """Count the characters searched for tokens."""
+
+            @staticmethod
+            def finditer(buffer: str, pos: int):
+                scanned[0] += len(buffer) - pos
+                return tokens.finditer(buffer, pos)
+
+        def decode(item_text: str):
+            decoded.append(len(item_text))
+            return json.loads(item_text)
+
+        with mock.patch.object(maze_api_client, "_TOKENS", CountingTokens), \
+                mock.patch.object(maze_api_client, "_decode", decode):
+            self.assertEqual(list(iter_json_array(chunks)), graphs)
+        # every item is decoded once and the text is scanned about once,
+        # the unfinished item is not scanned again with every chunk
+        self.assertEqual(len(decoded), len(graphs))
+        self.assertLessEqual(sum(decoded), len(text))
+        self.assertLess(scanned[0], 2 * len(text))
+
+    def test_from_api(self):
+        maze = Maze.from_api("stub", (7, 5), algo="Prims",
+                             client=self.client)
+        self.assertEqual(maze.size, (13, 9))
+        self.assertEqual(maze.array.shape, (9, 13))
+        self.assertEqual((maze.start, maze.finish), ((0, 0), (8, 12)))
+        maze.find_optimal_route()
+        self.assertIn("algorithm=Prims", StubHandler.requests[0][0])
+
+    def test_from_api_by_id(self):
+        maze = Maze.from_api("stub", maze_id="abc", client=self.client)
+        self.assertEqual(maze.size, (11, 9))
+        self.assertTrue(StubHandler.requests[0][0].endswith("/abc"))
+
+    def test_no_mazes(self):
+        with self.assertRaises(MazeConstructionError):
+            Maze.from_api("stub", algo="Prims", solution_len=1,
+                          client=self.client)
+
+    def test_bulk_from_api(self):
+        mazes = list(Maze.bulk_from_api("bulk", 20, (6, 6),
+                                        client=self.client))
+        self.assertEqual([maze.name for maze in mazes],
+                         [f"bulk_{index}" for index in range(20)])
+        for maze in mazes:
+            maze.find_optimal_route()
+        self.assertEqual(len(StubHandler.requests), 1)
+        self.assertIn("number=20", StubHandler.requests[0][0])
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            Maze.from_api("stub", client=self.client)
+        ports = {address for _, address in StubHandler.requests}
+        self.assertEqual(len(ports), 1)
+
+    def test_retry(self):
+        StubHandler.failures = 2
+        Maze.from_api("stub", client=self.client)
+        self.assertEqual(len(StubHandler.requests), 3)
+
+    def test_retries_exhausted(self):
+        StubHandler.failures = 10
+        with self.assertRaises(MazeAPIError):
+            Maze.from_api("stub", client=self.client)
+        self.assertEqual(len(StubHandler.requests), 4)
+
+    def test_timeout(self):
+        StubHandler.delay = threading.Event()
+        client = MazeAPIClient(self.url, timeout=(1, 0.2), retries=0)
+        try:
+            with self.assertRaises(MazeAPIError):
+                Maze.from_api("stub", client=client)
+        finally:
+            StubHandler.delay.set()
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Stress MazesList with web requests while mazes are being processed."""
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from modules.helper_collections.blocking_queue import BlockingQueue
+from modules.maze_operations.job_table import JobTable, DONE, FAILED
+from modules.maze_operations.maze_adt import Maze
+from modules.maze_operations.maze_list import MazesList
+from modules.maze_operations.process_maze import BackgroundProcessor
+
+DATABASE = Path(__file__).parent.parent / "modules" / "web_handling" / \
+    "static" / "database"
+SUBMITTERS = 6
+READERS = 8
+NAMES = 12  # every name is submitted by two threads
+
+
+def generate_array(seed: int) -> list:
+    """Generate a small solvable grid."""
+    rng = random.Random(seed)
+    array = [[int(rng.random() < 0.3) for _ in range(5)] for _ in range(5)]
+    # an open border guarantees a route
+    for i in range(5):
+        array[0][i] = array[i][4] = 0
+    array[0][0], array[4][4] = 2, 3
+    return array
+
+
+class MazesListConcurrencyTest(unittest.TestCase):
+    """Run request threads against an active background processor."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        database = Path(self.tmp) / "static" / "database"
+        database.mkdir(parents=True)
+        shutil.copy(DATABASE / "options.json", database)
+        (database / "mazes_list.json").write_text("[]", encoding="utf-8")
+        os.chdir(self.tmp)
+        # flask_session takes its default directory from the working
+        # directory and the app creates it when they are imported
+        from flask_session import Session
+        import modules.web_handling.app as web
+        self.web = web
+        # the app creates its list and queue only when run as a script
+        self.state = {name: getattr(web, name, None)
+                      for name in ("maze_list", "queue", "jobs")}
+        self.session = (web.app.config.get("SESSION_FILE_DIR"),
+                        web.app.session_interface)
+        web.app.config["SESSION_FILE_DIR"] = os.path.join(self.tmp,
+                                                          "flask_session")
+        Session(web.app)
+        web.maze_list = MazesList(compact_every=5)
+        web.queue = BlockingQueue()
+        web.jobs = JobTable()
+        self.processor = None
+        self.errors = []
+
+    def tearDown(self):
+        web = self.web
+        if self.processor is not None:
+            self.processor.stop(timeout=30)
+            self.assertFalse(self.processor.is_alive())
+        for name, value in self.state.items():
+            setattr(web, name, value)
+        web.app.config["SESSION_FILE_DIR"], web.app.session_interface = \
+            self.session
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _submit(self, names: list, job_ids: list):
+        web = self.web
+        client = web.app.test_client()
+        for name in names:
+            response = client.post("/editor/", json={
+                "name": name, "size": [5, 5],
+                "array": generate_array(int(name[len("maze_"):]))
+            })
+            if response.status_code != 200:
+                self.errors.append(f"submit {name}: {response.status_code}")
+            else:
+                job_ids.append(response.get_json()["job"])
+
+    def _read(self, stop: threading.Event, seed: int):
+        web = self.web
+        client = web.app.test_client()
+        rng = random.Random(seed)
+        last_version = -1
+        keys = list(web.maze_list.keys_to_reversed)
+        while not stop.is_set():
+            key = rng.choice(keys)
+            args = {"sort_option": key, "limit": rng.randint(1, 5),
+                    "page": rng.randint(1, 3)}
+            if rng.random() < 0.5:
+                args["User"] = ""
+            response = client.get("/api/stats", query_string=args)
+            if response.status_code != 200:
+                self.errors.append(f"stats: {response.status_code}")
+                continue
+            page = response.get_json()
+            if page["version"] < last_version:
+                self.errors.append("version went back")
+            last_version = page["version"]
+            values = [maze["parameters"][key] for maze in page["mazes"]]
+            if web.maze_list.keys_to_reversed[key]:
+                values = [-value for value in values]
+            if values != sorted(values) or len(values) > args["limit"]:
+                self.errors.append(f"bad page {args}: {values}")
+            if client.get("/stats.html").status_code not in (200, 304):
+                self.errors.append("stats page failed")
+
+    def test_requests_during_processing(self):
+        web = self.web
+        self.processor = BackgroundProcessor(
+            web.queue, web.maze_list, l_rates=(0.1,), discounts=(0.95, 0.75),
+            workers=0, warm_start=True, jobs=web.jobs
+        )
+        self.processor.start()
+        names = [f"maze_{index}" for index in range(NAMES)] * 2
+        random.Random(0).shuffle(names)
+        job_ids = []
+        stop = threading.Event()
+        readers = [threading.Thread(target=self._read, args=(stop, seed))
+                   for seed in range(READERS)]
+        submitters = [threading.Thread(target=self._submit,
+                                       args=(names[index::SUBMITTERS],
+                                             job_ids))
+                      for index in range(SUBMITTERS)]
+        for thread in readers + submitters:
+            thread.start()
+        for thread in submitters:
+            thread.join()
+
+        client = web.app.test_client()
+        deadline = time.time() + 120
+        states = {}
+        while len(states) < len(job_ids) and time.time() < deadline:
+            for job_id in job_ids:
+                state = client.get(f"/jobs/{job_id}").get_json()["state"]
+                if state in (DONE, FAILED):
+                    states[job_id] = state
+            time.sleep(0.05)
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(job_ids), 2 * NAMES)
+        # every name is processed exactly once, its duplicate fails
+        self.assertEqual(sorted(states.values()),
+                         sorted([DONE] * NAMES + [FAILED] * NAMES))
+        stored = [maze["name"] for maze in web.maze_list.mazes_list]
+        self.assertEqual(len(stored), len(set(stored)))
+        self.assertEqual(len(stored), NAMES * 2)
+        # every pending maze was replaced by its trained record
+        self.assertEqual(web.maze_list.snapshot().pending, frozenset())
+        for maze in web.maze_list.mazes_list:
+            self.assertIn("max_reward", maze["parameters"])
+        # the journal and the compacted list file hold every maze
+        web.maze_list.save()
+        reloaded = MazesList(compact_every=5)
+        self.assertEqual(sorted(maze["name"] for maze in
+                                reloaded.mazes_list), sorted(stored))
+
+    def test_reserve_name(self):
+        maze_list = self.web.maze_list
+        barrier = threading.Barrier(SUBMITTERS)
+        reserved = []
+
+        def reserve(index: int):
+            barrier.wait()
+            for name in range(NAMES):
+                if maze_list.reserve_name(f"maze_{name}"):
+                    reserved.append((name, index))
+
+        threads = [threading.Thread(target=reserve, args=(index,))
+                   for index in range(SUBMITTERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(name for name, _ in reserved),
+                         list(range(NAMES)))
+        self.assertEqual(maze_list.names,
+                         {f"maze_{name}" for name in range(NAMES)})
+
+    def test_failed_maze_releases_name(self):
+        web = self.web
+
+        class FlakyProcessor(BackgroundProcessor):
+            """Fail once after the pending mazes are listed."""
+            failures = 1
+
+            def _sweep(self, maze, job_id=None):
+                results = super()._sweep(maze, job_id)
+                if self.failures:
+                    self.failures -= 1
+                    raise RuntimeError("worker died")
+                return results
+
+        processor = FlakyProcessor(None, web.maze_list, l_rates=(0.1,),
+                                   discounts=(0.95,), workers=0,
+                                   jobs=web.jobs)
+        array = generate_array(0)
+        with self.assertRaises(RuntimeError):
+            processor.process_maze(Maze("flaky", size=(5, 5), array=array))
+        self.assertNotIn("flaky", web.maze_list.names)
+        self.assertEqual(web.maze_list.mazes_list, ())
+        job = web.jobs.create("flaky")
+        processor.process_maze(Maze("flaky", size=(5, 5), array=array),
+                               job.id)
+        self.assertEqual(web.jobs.get(job.id)["state"], DONE)
+        self.assertEqual([maze["name"] for maze in web.maze_list.mazes_list],
+                         ["flaky-0.1-0.95"])
+        # a stored maze keeps its name
+        web.maze_list.withdraw("flaky")
+        self.assertFalse(web.maze_list.reserve_name("flaky"))
+
+
+if __name__ == '__main__':
+    unittest.main()
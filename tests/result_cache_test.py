@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Test reusing stored training results of identical mazes."""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from modules.maze_operations.job_table import JobTable, CACHED, DONE
+from modules.maze_operations.maze_adt import Maze
+from modules.maze_operations.maze_list import MazesList
+from modules.maze_operations.process_maze import BackgroundProcessor
+from modules.maze_operations.result_cache import ResultCache
+
+DATABASE = Path(__file__).parent.parent / "modules" / "web_handling" / \
+    "static" / "database"
+ARRAY = [[2, 0, 0, 0],
+         [1, 1, 0, 1],
+         [0, 0, 0, 0],
+         [0, 1, 1, 3]]
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Process mazes on a temporary database and watch the cache."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        database = Path(self.tmp) / "static" / "database"
+        database.mkdir(parents=True)
+        shutil.copy(DATABASE / "options.json", database)
+        (database / "mazes_list.json").write_text("[]", encoding="utf-8")
+        # stored mazes go to the relative default database
+        os.chdir(self.tmp)
+        self.maze_list = MazesList()
+        self.results = ResultCache()
+        self.jobs = JobTable()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _process(self, name: str, l_rate: float = 0.1,
+                 discount: float = 0.95, warm_start: bool = False) -> str:
+        """Process a maze with the grid and get the state of its config."""
+        processor = BackgroundProcessor(
+            None, self.maze_list, l_rates=(l_rate,), discounts=(discount,),
+            workers=0, warm_start=warm_start, results=self.results,
+            jobs=self.jobs
+        )
+        job = self.jobs.create(name)
+        processor.process_maze(Maze(name, size=(4, 4), array=ARRAY), job.id)
+        state = self.jobs.get(job.id)
+        self.assertEqual(state["state"], DONE)
+        return state["configs"][f"{l_rate}-{discount}"]["state"]
+
+    def test_content_hash(self):
+        maze = Maze("first", size=(4, 4), array=ARRAY)
+        key = maze.content_hash(0.1, 0.95)
+        self.assertEqual(Maze("second", size=(4, 4),
+                              array=ARRAY).content_hash(0.1, 0.95), key)
+        self.assertNotEqual(maze.content_hash(0.3, 0.95), key)
+        self.assertNotEqual(maze.content_hash(0.1, 0.75), key)
+        self.assertNotEqual(maze.content_hash(0.1, 0.95, warm_start=True),
+                            key)
+
+    def test_same_grid_other_name(self):
+        self.assertEqual(self._process("first"), DONE)
+        self.assertEqual(self._process("second"), CACHED)
+        self.assertEqual(self.results.hits, 1)
+        first, second = (Maze.read_from_database(
+            f"static/database/{name}-0.1-0.95") for name in ("first",
+                                                             "second"))
+        self.assertEqual(first.q_data, second.q_data)
+        # the cache is kept in the database
+        self.assertIn(first.content_hash(), ResultCache())
+
+    def test_other_settings(self):
+        self.assertEqual(self._process("first"), DONE)
+        self.assertEqual(self._process("rate", l_rate=0.3), DONE)
+        self.assertEqual(self._process("discount", discount=0.75), DONE)
+        self.assertEqual(self._process("warm", warm_start=True), DONE)
+        self.assertEqual(self.results.hits, 0)
+        self.assertEqual(len(self.results), 4)
+        self.assertEqual(self._process("warm_again", warm_start=True),
+                         CACHED)
+
+
+if __name__ == '__main__':
+    unittest.main()